@@ -5,6 +5,7 @@
 
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import re
 import warnings
@@ -12,6 +13,8 @@ import warnings
 import requests
 import numpy as np
 import pandas as pd
+import pyod
+import sklearn
 from netdata_pandas.data import get_data, get_allmetrics_async
 from pyod.models.hbos import HBOS
 from pyod.models.pca import PCA
@@ -23,6 +26,7 @@ from pyod.models.copod import COPOD
 from sklearn.preprocessing import MinMaxScaler
 
 from bases.FrameworkServices.SimpleService import SimpleService
+from bases.trainer import BackgroundTrainer, ModelStore
 
 # ignore some sklearn/numpy warnings that are ok
 warnings.filterwarnings('ignore', r'All-NaN slice encountered')
@@ -32,7 +36,7 @@ warnings.filterwarnings('ignore', r'invalid value encountered in subtract')
 
 disabled_by_default = True
 
-ORDER = ['probability', 'anomaly']
+ORDER = ['probability', 'anomaly', 'training']
 
 CHARTS = {
     'probability': {
@@ -43,8 +47,91 @@ CHARTS = {
         'options': ['anomaly', 'Anomaly', 'count', 'anomalies', 'anomalies.anomaly', 'stacked'],
         'lines': []
     },
+    'training': {
+        'options': ['training', 'Models Training Time', 'seconds', 'training', 'anomalies.training', 'line'],
+        'lines': [
+            ['training_time', 'time', 'absolute', 1, 1000]
+        ]
+    },
 }
 
+# initial trainings which failed are retried after that many steps
+TRAIN_RETRY_N = 60
+
+
+class FeatureBuffer:
+    """Features of the latest sample for a model, the same as the last row of `Service.make_features()`.
+
+    Preallocated ring buffers hold the last `diffs_n + 1` samples, the last `smooth_n` differences and the last
+    `lags_n + 1` smoothed rows, so every new sample updates the features in O(dims).
+    """
+
+    def __init__(self, columns, diffs_n, smooth_n, lags_n, scaler=None):
+        """
+        :param columns <pd.Index>: dimensions of the model, in the order it was trained on.
+        :param diffs_n <int>: order of differencing.
+        :param smooth_n <int>: rolling mean window.
+        :param lags_n <int>: number of lagged rows.
+        :param scaler <MinMaxScaler>: fitted scaler applied to samples before anything else, if any.
+        """
+        self.columns = columns
+        self.params = (diffs_n, smooth_n, lags_n)
+        self.scaler = scaler
+        n_dims = len(columns)
+        self.diffs_n, self.smooth_n, self.lags_n = diffs_n, max(smooth_n, 1), lags_n
+        self.samples = np.zeros((diffs_n + 1, n_dims))
+        self.diffs = np.zeros((self.smooth_n, n_dims))
+        self.diffs_sum = np.zeros(n_dims)
+        self.smoothed = np.zeros((lags_n + 1, n_dims))
+        # n-th difference as a weighted sum of the samples (np.diff coefficients, oldest first), rotated to the
+        # ring position of the newest sample
+        coefs = np.diff(np.eye(diffs_n + 1), diffs_n, axis=0)[0]
+        size = diffs_n + 1
+        self.diff_weights = [coefs[(np.arange(size) - pos - 1) % size] for pos in range(size)]
+        self.last = None
+        self.n = 0
+
+    def is_same(self, columns, diffs_n, smooth_n, lags_n):
+        return self.scaler is None and self.params == (diffs_n, smooth_n, lags_n) and self.columns.equals(columns)
+
+    def push(self, sample):
+        """Add the latest sample.
+
+        :param sample <np.ndarray>: values of the model dimensions, NaN if missing.
+        :return: <np.ndarray> feature vector or None if there are not enough samples yet.
+        """
+        if self.last is not None:
+            sample = np.where(np.isnan(sample), self.last, sample)
+        self.last = sample
+        sample = np.nan_to_num(sample)
+        if self.scaler is not None:
+            sample = self.scaler.transform(sample.reshape(1, -1))[0]
+
+        size = self.diffs_n + 1
+        pos = self.n % size
+        self.samples[pos] = sample
+        self.n += 1
+        n_diffs = self.n - self.diffs_n
+        if n_diffs < 1:
+            return None
+
+        slot = (n_diffs - 1) % self.smooth_n
+        diff = self.diff_weights[pos] @ self.samples
+        self.diffs_sum += diff - self.diffs[slot]
+        self.diffs[slot] = diff
+        if slot == self.smooth_n - 1:
+            # no rounding errors pile up in the running sum
+            self.diffs_sum = self.diffs.sum(axis=0)
+        n_smoothed = n_diffs - self.smooth_n + 1
+        if n_smoothed < 1:
+            return None
+
+        self.smoothed[(n_smoothed - 1) % (self.lags_n + 1)] = self.diffs_sum / self.smooth_n
+        if n_smoothed < self.lags_n + 1:
+            return None
+        newest_first = (n_smoothed - 1 - np.arange(self.lags_n + 1)) % (self.lags_n + 1)
+        return self.smoothed[newest_first].ravel()
+
 
 class Service(SimpleService):
     def __init__(self, configuration=None, name=None):
@@ -76,10 +163,23 @@ class Service(SimpleService):
         self.password = self.configuration.get('password', None)
         self.tls_verify = self.configuration.get('tls_verify', True)
         self.fitted_at = {}
-        self.df_allmetrics = pd.DataFrame()
+        self.feature_buffers = {}
+        self.features = {}
+        self.score_ranges = {}
+        self.input_columns = pd.Index([])
+        self.input_slices = {}
         self.last_train_at = 0
+        self.train_failed_at = None
+        self.trainer = BackgroundTrainer(self.module_name, self.configuration.get('training_concurrency', 1))
+        self.persist_models = bool(self.configuration.get('persist_models', True))
+        self.model_store = ModelStore(self.name)
+        self.model_store_key = ModelStore.key(
+            self.configuration, (pyod.__version__, sklearn.__version__, np.__version__, pd.__version__))
+        self.models_loaded = False
         self.include_average_prob = bool(self.configuration.get('include_average_prob', True))
         self.reinitialize_at_every_step = bool(self.configuration.get('reinitialize_at_every_step', False))
+        self.predict_workers = int(self.configuration.get('predict_workers', 0))
+        self.predict_pool = ThreadPoolExecutor(max_workers=self.predict_workers) if self.predict_workers > 1 else None
 
     def charts_init(self):
         """Do some initialisation of charts in scope related variables.
@@ -166,35 +266,32 @@ class Service(SimpleService):
             self.models = {model: HBOS(contamination=self.contamination) for model in self.models_in_scope}
         self.custom_model_scalers = {model: MinMaxScaler() for model in self.models_in_scope}
 
-    def model_init(self, model):
-        """Model initialisation of a single model.
+    def new_model(self):
+        """Create a new, not fitted, model of the configured type.
         """
         if self.model == 'pca':
-            self.models[model] = PCA(contamination=self.contamination)
+            return PCA(contamination=self.contamination)
         elif self.model == 'loda':
-            self.models[model] = LODA(contamination=self.contamination)
+            return LODA(contamination=self.contamination)
         elif self.model == 'iforest':
-            self.models[model] = IForest(n_estimators=50, bootstrap=True, behaviour='new', contamination=self.contamination)
+            return IForest(n_estimators=50, bootstrap=True, behaviour='new', contamination=self.contamination)
         elif self.model == 'cblof':
-            self.models[model] = CBLOF(n_clusters=3, contamination=self.contamination)
+            return CBLOF(n_clusters=3, contamination=self.contamination)
         elif self.model == 'feature_bagging':
-            self.models[model] = FeatureBagging(base_estimator=PCA(contamination=self.contamination), contamination=self.contamination)
+            return FeatureBagging(base_estimator=PCA(contamination=self.contamination), contamination=self.contamination)
         elif self.model == 'copod':
-            self.models[model] = COPOD(contamination=self.contamination)
+            return COPOD(contamination=self.contamination)
         elif self.model == 'hbos':
-            self.models[model] = HBOS(contamination=self.contamination)
+            return HBOS(contamination=self.contamination)
         else:
-            self.models[model] = HBOS(contamination=self.contamination)
-        self.custom_model_scalers[model] = MinMaxScaler()
+            return HBOS(contamination=self.contamination)
 
     def reinitialize(self):
-        """Reinitialize charts, models and data to a beginning state.
+        """Refresh the charts and models in scope. Trained models are kept until the next training replaces them.
         """
         self.charts_init()
         self.custom_models_init()
-        self.data_init()
         self.model_params_init()
-        self.models_init()
 
     def save_data_latest(self, data, data_probability, data_anomaly):
         """Save the most recent data objects to be used if needed in the future.
@@ -216,24 +313,52 @@ class Service(SimpleService):
                 self.collected_dims[chart].remove(dim)
                 self.charts[chart].del_dimension(dim, hide=False)
 
-    def add_custom_models_dims(self, df):
+    def add_custom_models_dims(self, df, dims=None, dims_renamed=None):
         """Given a df, select columns used by custom models, add custom model name as prefix, and append to df.
 
         :param df <pd.DataFrame>: dataframe to append new renamed columns to.
+        :param dims <list>: dimensions used by the custom models, the current ones if not given.
+        :param dims_renamed <list>: the same dimensions prefixed with the custom model name.
         :return: <pd.DataFrame> dataframe with additional columns added relating to the specified custom models.
         """
-        df_custom = df[self.custom_models_dims].copy()
-        df_custom.columns = self.custom_models_dims_renamed
+        if dims is None:
+            dims, dims_renamed = self.custom_models_dims, self.custom_models_dims_renamed
+        df_custom = df[dims].copy()
+        df_custom.columns = dims_renamed
         df = df.join(df_custom)
 
         return df
 
-    def make_features(self, arr, train=False, model=None):
+    def training_spec(self, models_to_train=None):
+        """Snapshot of the models and parameters a training uses. The training runs in the background and
+        `reinitialize()` may replace them on the job thread meanwhile.
+
+        :param models_to_train <list>: list of models to train, all models in scope if not given.
+        :return: <dict>
+        """
+        models = list(self.models_in_scope if models_to_train is None else models_to_train)
+        custom_models_names = self.custom_models_names if self.custom_models else []
+        return {
+            'host_charts_dict': {host: list(charts) for host, charts in self.host_charts_dict.items()},
+            'models': models,
+            'models_in_scope': list(self.models_in_scope),
+            'params': {model: (self.diffs_n[model], self.smooth_n[model], self.lags_n[model]) for model in models},
+            'normalize': [model for model in models if self.custom_models_normalize and model in custom_models_names],
+            'custom_models_dims': list(self.custom_models_dims) if self.custom_models else None,
+            'custom_models_dims_renamed': list(self.custom_models_dims_renamed) if self.custom_models else None,
+            'train_max_n': self.train_max_n,
+            'train_n_secs': self.train_n_secs,
+            'offset_n_secs': self.offset_n_secs,
+        }
+
+    def make_features(self, arr, train=False, model=None, scaler=None, spec=None):
         """Take in numpy array and preprocess accordingly by taking diffs, smoothing and adding lags.
 
         :param arr <np.ndarray>: numpy array we want to make features from.
         :param train <bool>: True if making features for training, in which case need to fit_transform scaler and maybe sample train_max_n.
         :param model <str>: model to make features for.
+        :param scaler <MinMaxScaler>: scaler to use instead of the model one, a new one when training.
+        :param spec <dict>: `training_spec()` with the model parameters, the current ones if not given.
         :return: <np.ndarray> transformed numpy array.
         """
 
@@ -246,15 +371,16 @@ class Service(SimpleService):
 
         arr = np.nan_to_num(arr)
 
-        diffs_n = self.diffs_n[model]
-        smooth_n = self.smooth_n[model]
-        lags_n = self.lags_n[model]
+        if spec is None:
+            spec = self.training_spec([model])
+        diffs_n, smooth_n, lags_n = spec['params'][model]
 
-        if self.custom_models_normalize and model in self.custom_models_names:
+        if model in spec['normalize']:
+            scaler = scaler or self.custom_model_scalers[model]
             if train:
-                arr = self.custom_model_scalers[model].fit_transform(arr)
+                arr = scaler.fit_transform(arr)
             else:
-                arr = self.custom_model_scalers[model].transform(arr)
+                arr = scaler.transform(arr)
 
         if diffs_n > 0:
             arr = np.diff(arr, diffs_n, axis=0)
@@ -273,67 +399,135 @@ class Service(SimpleService):
             arr = arr[~np.isnan(arr).any(axis=1)]
 
         if train:
-            if len(arr) > self.train_max_n:
-                arr = arr[np.random.randint(arr.shape[0], size=self.train_max_n), :]
+            if len(arr) > spec['train_max_n']:
+                arr = arr[np.random.randint(arr.shape[0], size=spec['train_max_n']), :]
 
         arr = np.nan_to_num(arr)
 
         return arr
 
-    def train(self, models_to_train=None, train_data_after=0, train_data_before=0):
-        """Pull required training data and train a model for each specified model.
+    def train(self, spec, train_data_after=0, train_data_before=0):
+        """Pull required training data and train a model for each specified model. Runs in the background, the
+        trained models are swapped in by `apply_training()`.
 
-        :param models_to_train <list>: list of models to train on.
+        :param spec <dict>: `training_spec()` taken when the training was started.
         :param train_data_after <int>: integer timestamp for start of train data.
         :param train_data_before <int>: integer timestamp for end of train data.
+        :return: <dict> trained models, their scalers, input columns and training score ranges.
         """
         now = datetime.now().timestamp()
         if train_data_after > 0 and train_data_before > 0:
             before = train_data_before
             after = train_data_after
         else:
-            before = int(now) - self.offset_n_secs
-            after =  before - self.train_n_secs
+            before = int(now) - spec['offset_n_secs']
+            after =  before - spec['train_n_secs']
 
         # get training data
         df_train = get_data(
-            host_charts_dict=self.host_charts_dict, host_prefix=True, host_sep='::', after=after, before=before,
+            host_charts_dict=spec['host_charts_dict'], host_prefix=True, host_sep='::', after=after, before=before,
             sort_cols=True, numeric_only=True, protocol=self.protocol, float_size='float32', user=self.username, pwd=self.password,
             verify=self.tls_verify
         ).ffill()
-        if self.custom_models:
-            df_train = self.add_custom_models_dims(df_train)
+        if spec['custom_models_dims'] is not None:
+            df_train = self.add_custom_models_dims(df_train, spec['custom_models_dims'], spec['custom_models_dims_renamed'])
 
         # train model
-        self.try_fit(df_train, models_to_train=models_to_train)
-        self.info(f'training complete in {round(time.time() - now, 2)} seconds (runs_counter={self.runs_counter}, model={self.model}, train_n_secs={self.train_n_secs}, models={len(self.fitted_at)}, n_fit_success={self.n_fit_success}, n_fit_fails={self.n_fit_fail}, after={after}, before={before}).')
-        self.last_train_at = self.runs_counter
+        trained = self.try_fit(df_train, spec)
+        self.info(f'training complete in {round(time.time() - now, 2)} seconds (runs_counter={self.runs_counter}, model={self.model}, train_n_secs={spec["train_n_secs"]}, models={len(trained["models"])}, n_fit_success={trained["n_fit_success"]}, n_fit_fails={trained["n_fit_fail"]}, after={after}, before={before}).')
+
+        # save the models for a restart, only if they are all of them
+        if self.persist_models and set(spec['models_in_scope']) <= set(trained['models']):
+            if not self.model_store.save(self.model_store_key, trained):
+                self.info(f'failed to save the trained models to {self.model_store.path}')
+        return trained
 
-    def try_fit(self, df_train, models_to_train=None):
+    def load_models(self):
+        """Load the models saved after the last training if they are not older than the retraining interval.
+        """
+        max_age = self.train_every_n * self.update_every if self.train_every_n > 0 else None
+        trained, age = self.model_store.load(self.model_store_key, max_age)
+        if trained is None:
+            return
+        self.apply_training(trained)
+        self.info(f'loaded {len(trained["models"])} models trained {round(age)} seconds ago from {self.model_store.path}')
+
+    def try_fit(self, df_train, spec):
         """Try fit each model and try to fallback to a default model if fit fails for any reason.
 
         :param df_train <pd.DataFrame>: data to train on.
-        :param models_to_train <list>: list of models to train.
+        :param spec <dict>: `training_spec()` with the models to train and their parameters.
+        :return: <dict> trained models, their scalers, input columns, feature parameters and training score ranges.
         """
-        if models_to_train is None:
-            models_to_train = list(self.models.keys())
-        self.n_fit_fail, self.n_fit_success = 0, 0
-        for model in models_to_train:
-            if model not in self.models:
-                self.model_init(model)
-            X_train = self.make_features(
-                df_train[df_train.columns[df_train.columns.str.startswith(f'{model}|')]].values,
-                train=True, model=model)
+        trained = {
+            'models': {}, 'scalers': {}, 'columns': {}, 'params': {}, 'score_ranges': {}, 'n_fit_success': 0, 'n_fit_fail': 0
+        }
+        for model in spec['models']:
+            columns = df_train.columns[df_train.columns.str.startswith(f'{model}|')]
+            scaler = MinMaxScaler()
+            X_train = self.make_features(df_train[columns].values, train=True, model=model, scaler=scaler, spec=spec)
+            clf = self.new_model()
             try:
-                self.models[model].fit(X_train)
-                self.n_fit_success += 1
+                clf.fit(X_train)
+                trained['n_fit_success'] += 1
             except Exception as e:
-                self.n_fit_fail += 1
+                trained['n_fit_fail'] += 1
                 self.info(e)
                 self.info(f'training failed for {model} at run_counter {self.runs_counter}, defaulting to hbos model.')
-                self.models[model] = HBOS(contamination=self.contamination)
-                self.models[model].fit(X_train)
+                clf = HBOS(contamination=self.contamination)
+                clf.fit(X_train)
+            trained['models'][model] = clf
+            trained['scalers'][model] = scaler if model in spec['normalize'] else None
+            trained['columns'][model] = columns
+            trained['params'][model] = spec['params'][model]
+            # predict_proba() scales scores linearly to the range of the training scores
+            trained['score_ranges'][model] = (clf.decision_scores_.min(), clf.decision_scores_.max())
+        return trained
+
+    def apply_training(self, trained):
+        """Swap in newly trained models, they are used from the next prediction on.
+
+        :param trained <dict>: result of `train()`.
+        """
+        for model, clf in trained['models'].items():
+            # the scope changed while training
+            if model not in self.models_in_scope:
+                continue
+            self.models[model] = clf
+            self.custom_model_scalers[model] = trained['scalers'][model]
+            self.score_ranges[model] = trained['score_ranges'][model]
+            self.feature_buffers[model] = self.feature_buffer(
+                model, trained['columns'][model], trained['params'][model], trained['scalers'][model])
             self.fitted_at[model] = self.runs_counter
+        # models not in scope anymore
+        for model in [m for m in self.fitted_at if m not in self.models_in_scope]:
+            for d in (self.fitted_at, self.models, self.custom_model_scalers, self.feature_buffers, self.score_ranges):
+                d.pop(model, None)
+        self.update_inputs()
+        self.last_train_at = self.runs_counter
+
+    def update_inputs(self):
+        """Precompute the columns selected from allmetrics on every prediction and the slice of each model in them.
+        """
+        columns, self.input_slices = [], {}
+        for model, buffer in self.feature_buffers.items():
+            self.input_slices[model] = slice(len(columns), len(columns) + len(buffer.columns))
+            columns.extend(buffer.columns)
+        self.input_columns = pd.Index(columns)
+
+    def feature_buffer(self, model, columns, params, scaler=None):
+        """Feature buffer of a trained model, the current one (and its history) is kept if the inputs didn't change.
+
+        :param model <str>: model to get the buffer for.
+        :param columns <pd.Index>: dimensions the model was trained on.
+        :param params <tuple>: diffs_n, smooth_n and lags_n the model was trained with.
+        :param scaler <MinMaxScaler>: scaler fitted on the training data if the model normalizes its inputs.
+        :return: <FeatureBuffer>
+        """
+        buffer = self.feature_buffers.get(model)
+        if scaler is None and buffer is not None and buffer.is_same(columns, *params):
+            return buffer
+        return FeatureBuffer(columns, *params, scaler=scaler)
 
     def predict(self):
         """Get latest data, make it into a feature vector, and get predictions for each available model.
@@ -347,39 +541,58 @@ class Service(SimpleService):
             )
         if self.custom_models:
             df_allmetrics = self.add_custom_models_dims(df_allmetrics)
-        self.df_allmetrics = self.df_allmetrics.append(df_allmetrics).ffill().tail((max(self.lags_n.values()) + max(self.smooth_n.values()) + max(self.diffs_n.values())) * 2)
+        sample = df_allmetrics.reindex(columns=self.input_columns).values[-1].astype(float)
+        self.features = {
+            model: buffer.push(sample[self.input_slices[model]]) for model, buffer in self.feature_buffers.items()
+        }
 
         # get predictions
         data_probability, data_anomaly = self.try_predict()
 
         return data_probability, data_anomaly
 
+    def score(self, model):
+        """Score the latest features of a model once, the probability and the anomaly flag both come from that score
+        (the same as `predict_proba()` with the default linear method and `predict()`).
+
+        :param model <str>: model to score.
+        :return: (<float>,<int>) probability (x10000) and anomaly flag, None if the model can't be scored.
+        """
+        try:
+            features = self.features.get(model)
+            if features is None:
+                raise ValueError(f'not enough data to make features for {model} yet')
+            clf = self.models[model]
+            score = clf.decision_function(np.nan_to_num(features.reshape(1, -1)))[-1]
+            low, high = self.score_ranges[model]
+            probability = (score - low) / (high - low) if high > low else score - low
+            return np.nan_to_num(np.clip(probability, 0, 1)) * 10000, int(score > clf.threshold_)
+        except Exception as _:
+            #self.info(e)
+            return None
+
     def try_predict(self):
         """Try make prediction and fall back to last known prediction if fails.
 
         :return: (<dict>,<dict>) tuple of dictionaries, one for probability scores and the other for anomaly predictions.
         """
         data_probability, data_anomaly = {}, {}
-        for model in self.fitted_at.keys():
-            model_display_name = self.model_display_names[model]
-            try:
-                X_model = np.nan_to_num(
-                    self.make_features(
-                        self.df_allmetrics[self.df_allmetrics.columns[self.df_allmetrics.columns.str.startswith(f'{model}|')]].values,
-                        model=model
-                    )[-1,:].reshape(1, -1)
-                )
-                data_probability[model_display_name + '_prob'] = np.nan_to_num(self.models[model].predict_proba(X_model)[-1][1]) * 10000
-                data_anomaly[model_display_name + '_anomaly'] = self.models[model].predict(X_model)[-1]
-            except Exception as _:
-                #self.info(e)
-                if model_display_name + '_prob' in self.data_latest:
-                    #self.info(f'prediction failed for {model} at run_counter {self.runs_counter}, using last prediction instead.')
-                    data_probability[model_display_name + '_prob'] = self.data_latest[model_display_name + '_prob']
-                    data_anomaly[model_display_name + '_anomaly'] = self.data_latest[model_display_name + '_anomaly']
-                else:
-                    #self.info(f'prediction failed for {model} at run_counter {self.runs_counter}, skipping as no previous prediction.')
-                    continue
+        models = list(self.fitted_at.keys())
+        if self.predict_pool:
+            # models scored in native code (numpy, scikit-learn) release the GIL
+            results = self.predict_pool.map(self.score, models)
+        else:
+            results = map(self.score, models)
+        for model, result in zip(models, results):
+            model_display_name = self.model_display_names.get(model, model.split('::')[-1])
+            if result is not None:
+                data_probability[model_display_name + '_prob'], data_anomaly[model_display_name + '_anomaly'] = result
+            elif model_display_name + '_prob' in self.data_latest:
+                #self.info(f'prediction failed for {model} at run_counter {self.runs_counter}, using last prediction instead.')
+                data_probability[model_display_name + '_prob'] = self.data_latest[model_display_name + '_prob']
+                data_anomaly[model_display_name + '_anomaly'] = self.data_latest[model_display_name + '_anomaly']
+            #else:
+                #self.info(f'prediction failed for {model} at run_counter {self.runs_counter}, skipping as no previous prediction.')
 
         return data_probability, data_anomaly
 
@@ -391,20 +604,39 @@ class Service(SimpleService):
             self.custom_models_init()
             self.model_params_init()
 
-        # if not all models have been trained then train those we need to
-        if len(self.fitted_at) < len(self.models_in_scope):
-            self.train(
-                models_to_train=[m for m in self.models_in_scope if m not in self.fitted_at],
-                train_data_after=self.initial_train_data_after,
-                train_data_before=self.initial_train_data_before
-            )
-        # retrain all models as per schedule from config
-        elif self.train_every_n > 0 and self.runs_counter % self.train_every_n == 0:
-            self.reinitialize()
-            self.train()
-
-        # roll forward previous predictions around a training step to avoid the possibility of having the training itself trigger an anomaly
-        if (self.runs_counter - self.last_train_at) <= self.train_no_prediction_n:
+        # reuse the models saved by the previous run if they are still fresh
+        if self.persist_models and not self.models_loaded:
+            self.models_loaded = True
+            self.load_models()
+
+        # swap in the models of a finished training
+        result = self.trainer.poll()
+        if result is not None:
+            if result.error is not None:
+                self.error(f'training failed at run_counter {self.runs_counter}: {result.error}')
+                self.train_failed_at = self.runs_counter
+            else:
+                self.train_failed_at = None
+                self.apply_training(result.value)
+
+        # training runs in the background, predictions continue with the current models meanwhile
+        if not self.trainer.busy():
+            # if not all models have been trained then train those we need to
+            if len(self.fitted_at) < len(self.models_in_scope):
+                if self.train_failed_at is None or self.runs_counter - self.train_failed_at >= TRAIN_RETRY_N:
+                    self.trainer.start(
+                        self.train,
+                        self.training_spec(models_to_train=[m for m in self.models_in_scope if m not in self.fitted_at]),
+                        train_data_after=self.initial_train_data_after,
+                        train_data_before=self.initial_train_data_before
+                    )
+            # retrain all models as per schedule from config
+            elif self.train_every_n > 0 and self.runs_counter % self.train_every_n == 0:
+                self.reinitialize()
+                self.trainer.start(self.train, self.training_spec())
+
+        # roll forward previous predictions until the first models are trained and around a training step to avoid the possibility of having the training itself trigger an anomaly
+        if not self.fitted_at or (self.runs_counter - self.last_train_at) <= self.train_no_prediction_n:
             data_probability = self.data_probability_latest
             data_anomaly = self.data_anomaly_latest
         else:
@@ -414,6 +646,7 @@ class Service(SimpleService):
                 data_probability['average_prob'] = 0 if np.isnan(average_prob) else average_prob
         
         data = {**data_probability, **data_anomaly}
+        data['training_time'] = int(self.trainer.last_elapsed * 1000)
 
         self.validate_charts('probability', data_probability, divisor=100)
         self.validate_charts('anomaly', data_anomaly)
@@ -9,6 +9,7 @@ from collections import defaultdict
 from glob import glob
 
 from bases.FrameworkServices.LogService import LogService
+from bases.matcher import LineMatcher
 
 ORDER = [
     'jails_failed_attempts',
@@ -62,11 +63,17 @@ ACTION_FOUND = 'Found'
 # 2018-09-12 11:45:58,727 fail2ban.actions[25029]: WARNING [ssh] Ban 203.0.113.1
 # 2018-09-12 11:45:58,727 fail2ban.actions[25029]: WARNING [ssh] Restore Ban 203.0.113.1
 # 2018-09-12 11:45:53,715 fail2ban.actions[25029]: WARNING [ssh] Unban 203.0.113.1
-RE_DATA = re.compile(
-    r'\[(?P<jail>[A-Za-z-_0-9]+)\] (?P<action>{0}|{1}|{2}|{3}) (?P<ip>[a-f0-9.:]+)'.format(
-        ACTION_BAN, ACTION_UNBAN, ACTION_RESTORE_BAN, ACTION_FOUND
-    )
-)
+RE_FOUND = r'\[([A-Za-z-_0-9]+)\] {0} [a-f0-9.:]+'.format(ACTION_FOUND)
+RE_ACTIONS = r'\[([A-Za-z-_0-9]+)\] ({0}|{1}|{2}) ([a-f0-9.:]+)'.format(ACTION_BAN, ACTION_UNBAN, ACTION_RESTORE_BAN)
+
+
+def log_matcher():
+    matcher = LineMatcher()
+    matcher.add('found', RE_FOUND, prefilter='] {0} '.format(ACTION_FOUND), key='{0}_failed_attempts')
+    # 'an ' is the common part of 'Ban ', 'Unban ' and 'Restore Ban '
+    matcher.add('actions', RE_ACTIONS, prefilter='an ', ordered=True)
+    return matcher
+
 
 DEFAULT_JAILS = [
     'ssh',
@@ -83,7 +90,9 @@ class Service(LogService):
         self.conf_dir = self.configuration.get('conf_dir', '/etc/fail2ban/jail.d/')
         self.exclude = self.configuration.get('exclude', str())
         self.monitoring_jails = list()
+        self.in_jail_keys = dict()
         self.banned_ips = defaultdict(set)
+        self.matcher = log_matcher()
         self.data = dict()
 
     def check(self):
@@ -107,6 +116,8 @@ class Service(LogService):
             self.data['{0}_failed_attempts'.format(jail)] = 0
             self.data[jail] = 0
             self.data['{0}_in_jail'.format(jail)] = 0
+            self.in_jail_keys[jail] = '{0}_in_jail'.format(jail)
+        self.matcher.precompute('found', self.monitoring_jails)
 
         self.definitions = charts(self.monitoring_jails)
         self.info('monitoring jails: {0}'.format(self.monitoring_jails))
@@ -117,35 +128,27 @@ class Service(LogService):
         """
         :return: dict
         """
-        raw = self._get_raw_data()
+        raw = self._get_raw_data(lazy=True)
 
-        if not raw:
-            return None if raw is None else self.data
+        if raw is None:
+            return None
 
-        for row in raw:
-            match = RE_DATA.search(row)
+        counters, matches = self.matcher.feed(raw)
+        self.matcher.update(self.data, counters)
 
-            if not match:
+        for jail, action, ip in matches['actions']:
+            if jail not in self.in_jail_keys:
                 continue
 
-            match = match.groupdict()
-
-            if match['jail'] not in self.monitoring_jails:
-                continue
-
-            jail, action, ip = match['jail'], match['action'], match['ip']
-
-            if action == ACTION_FOUND:
-                self.data['{0}_failed_attempts'.format(jail)] += 1
-            elif action in (ACTION_BAN, ACTION_RESTORE_BAN):
+            if action in (ACTION_BAN, ACTION_RESTORE_BAN):
                 self.data[jail] += 1
                 if ip not in self.banned_ips[jail]:
                     self.banned_ips[jail].add(ip)
-                    self.data['{0}_in_jail'.format(jail)] += 1
+                    self.data[self.in_jail_keys[jail]] += 1
             elif action == ACTION_UNBAN:
                 if ip in self.banned_ips[jail]:
                     self.banned_ips[jail].remove(ip)
-                    self.data['{0}_in_jail'.format(jail)] -= 1
+                    self.data[self.in_jail_keys[jail]] -= 1
 
         return self.data
 
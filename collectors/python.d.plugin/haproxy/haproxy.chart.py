@@ -290,10 +290,10 @@ class Service(UrlService, SocketService):
         return match.groupdict() if match else dict()
 
     @staticmethod
-    def _check_raw_data(data):
+    def _check_raw_bytes(data):
         """
         Check if all data has been gathered from socket
-        :param data: str
+        :param data: bytearray
         :return: boolean
         """
         return not bool(data)
@@ -95,5 +95,5 @@ class Service(SocketService):
         return True
 
     @staticmethod
-    def _check_raw_data(data):
+    def _check_raw_bytes(data):
         return not bool(data)
@@ -177,8 +177,8 @@ class Service(SocketService):
 
         return data
 
-    def _check_raw_data(self, data):
-        if data.endswith('END\r\n'):
+    def _check_raw_bytes(self, data):
+        if data.endswith(b'END\r\n'):
             self.debug('received full response from memcached')
             return True
 
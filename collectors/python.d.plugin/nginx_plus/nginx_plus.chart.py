@@ -7,7 +7,6 @@ import re
 
 from collections import defaultdict
 from copy import deepcopy
-from json import loads
 
 try:
     from collections import OrderedDict
@@ -433,13 +432,8 @@ class Service(UrlService):
         if not self._manager:
             return None
 
-        raw_data = self._get_raw_data()
-        if not raw_data:
-            return None
-
-        try:
-            response = loads(raw_data)
-        except ValueError:
+        response = self._get_json()
+        if not response:
             return None
 
         for obj_cls in [WebZone, WebUpstream, Cache]:
@@ -458,10 +452,9 @@ class Service(UrlService):
         Format data received from http request
         :return: dict
         """
-        raw_data = self._get_raw_data()
-        if not raw_data:
+        response = self._get_json()
+        if not response:
             return None
-        response = loads(raw_data)
 
         data = parse_json(response, METRICS['SERVER'])
         data['ssl_memory_usage'] = data['slabs_SSL_pages_used'] / float(data['slabs_SSL_pages_free']) * 1e4
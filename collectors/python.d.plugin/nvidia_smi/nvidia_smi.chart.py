@@ -5,12 +5,12 @@
 # User Memory Stat Author: Guido Scatena (scatenag)
 
 import subprocess
-import threading
 import os
 import pwd
 
 import xml.etree.ElementTree as et
 
+from bases.FrameworkServices.ExecutableService import CommandStream
 from bases.FrameworkServices.SimpleService import SimpleService
 from bases.collection import find_binary
 
@@ -18,9 +18,7 @@ disabled_by_default = True
 
 NVIDIA_SMI = 'nvidia-smi'
 
-EMPTY_ROW = ''
-EMPTY_ROW_LIMIT = 500
-POLLER_BREAK_ROW = '</nvidia_smi_log>'
+POLLER_BREAK_ROW = b'</nvidia_smi_log>'
 
 PCI_BANDWIDTH = 'pci_bandwidth'
 FAN_SPEED = 'fan_speed'
@@ -156,39 +154,21 @@ def gpu_charts(gpu):
 class NvidiaSMI:
     def __init__(self):
         self.command = find_binary(NVIDIA_SMI)
-        self.active_proc = None
 
     def run_once(self):
         proc = subprocess.Popen([self.command, '-x', '-q'], stdout=subprocess.PIPE)
         stdout, _ = proc.communicate()
         return stdout
 
-    def run_loop(self, interval):
-        if self.active_proc:
-            self.kill()
-        proc = subprocess.Popen([self.command, '-x', '-q', '-l', str(interval)], stdout=subprocess.PIPE)
-        self.active_proc = proc
-        return proc.stdout
+    def loop_command(self, interval):
+        return [self.command, '-x', '-q', '-l', str(interval)]
 
-    def kill(self):
-        if self.active_proc:
-            self.active_proc.kill()
-            self.active_proc = None
 
-
-class NvidiaSMIPoller(threading.Thread):
+class NvidiaSMIPoller:
     def __init__(self, poll_interval):
-        threading.Thread.__init__(self)
-        self.daemon = True
-
         self.smi = NvidiaSMI()
         self.interval = poll_interval
-
-        self.lock = threading.RLock()
-        self.last_data = str()
-        self.exit = False
-        self.empty_rows = 0
-        self.rows = list()
+        self.stream = None
 
     def has_smi(self):
         return bool(self.smi.command)
@@ -196,39 +176,24 @@ class NvidiaSMIPoller(threading.Thread):
     def run_once(self):
         return self.smi.run_once()
 
-    def run(self):
-        out = self.smi.run_loop(self.interval)
-
-        for row in out:
-            if self.exit or self.empty_rows > EMPTY_ROW_LIMIT:
-                break
-            self.process_row(row)
-        self.smi.kill()
-
-    def process_row(self, row):
-        row = row.decode()
-        self.empty_rows += (row == EMPTY_ROW)
-        self.rows.append(row)
-
-        if POLLER_BREAK_ROW in row:
-            self.lock.acquire()
-            self.last_data = '\n'.join(self.rows)
-            self.lock.release()
-
-            self.rows = list()
-            self.empty_rows = 0
+    def start(self):
+        self.stream = CommandStream(self.smi.loop_command(self.interval), POLLER_BREAK_ROW)
+        self.stream.start()
 
     def is_started(self):
-        return self.ident is not None
+        return self.stream is not None
+
+    def is_alive(self):
+        # the command is restarted if it exits
+        return self.stream.is_alive()
 
     def shutdown(self):
-        self.exit = True
+        if self.stream:
+            self.stream.stop()
 
     def data(self):
-        self.lock.acquire()
-        data = self.last_data
-        self.lock.release()
-        return data
+        record, _ = self.stream.record()
+        return record.decode() if record else str()
 
 
 def handle_attr_error(method):
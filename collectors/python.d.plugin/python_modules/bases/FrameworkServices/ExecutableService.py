@@ -5,31 +5,322 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
+import sys
+import threading
 
 from subprocess import Popen, PIPE
 
+from third_party.monotonic import monotonic
+
 from bases.FrameworkServices.SimpleService import SimpleService
 from bases.collection import find_binary
+from bases.forkserver import FORK_SERVER, DEVNULL
+
+PY3 = sys.version_info[0] > 2
+
+STREAM_READ_SIZE = 64 * 1024
+STREAM_MAX_RECORD = 16 * 1024 * 1024
+STREAM_BACKOFF_MAX = 60
+STREAM_STABLE_AFTER = 60  # a command running longer than that resets the restart backoff
+STREAM_STALE_AFTER = 5  # update_every intervals without a new record
+
+EXEC_CACHE_TTL = 0.5  # of update_every, the next run of the job always executes the command again
+EXEC_STALE_MAX = 3  # of update_every, max age of a previous output used while the command is executed again
+
+EXEC_CHART_CREATE = "CHART netdata.runtime_{job_name}_exec '' 'Executed commands' 'commands' 'python.d' " \
+                    "netdata.pythond_runtime_exec stacked 145000 {update_every} '' " \
+                    "'python.d.plugin' '{module_name}'\n" \
+                    "DIMENSION executed 'executed' absolute 1 1\n" \
+                    "DIMENSION cached 'cached' absolute 1 1\n" \
+                    "CHART netdata.runtime_{job_name}_exec_time '' 'Commands execution time' 'ms' 'python.d' " \
+                    "netdata.pythond_runtime_exec_time line 145000 {update_every} '' " \
+                    "'python.d.plugin' '{module_name}'\n" \
+                    "DIMENSION exec_time 'exec time' absolute 1 1000\n"
+
+EXEC_CHART_UPDATE = 'BEGIN netdata.runtime_{job_name}_exec {since_last}\n' \
+                    'SET executed = {executed}\n' \
+                    'SET cached = {cached}\n' \
+                    'END\n' \
+                    'BEGIN netdata.runtime_{job_name}_exec_time {since_last}\n' \
+                    'SET exec_time = {exec_time}\n' \
+                    'END\n'
+
+
+def decode_lines(data):
+    lines = list()
+    for line in data.splitlines(True):
+        try:
+            lines.append(line.decode('utf-8'))
+        except (TypeError, UnicodeDecodeError):
+            continue
+    return lines
+
+
+def iter_lines(data):
+    """
+    Lazily splits raw output into lines (without the line break), nothing is decoded.
+    :param data: <bytes>
+    """
+    start, size = 0, len(data)
+    while start < size:
+        end = data.find(b'\n', start)
+        if end < 0:
+            yield data[start:]
+            return
+        yield data[start:end]
+        start = end + 1
+
+
+def find_all(regex, data):
+    """
+    Runs a compiled bytes regex over the whole raw output, only the matched groups are decoded.
+    :param regex: compiled bytes pattern, re.compile(br'...')
+    :param data: <bytes>
+    :return: <list> of groups tuples (or of the group if there is only one), like re.findall
+    """
+    if not PY3:
+        return regex.findall(data)
+    if regex.groups == 1:
+        return [m.group(1).decode('utf-8', 'replace') for m in regex.finditer(data)]
+    return [tuple(g.decode('utf-8', 'replace') if g is not None else '' for g in m.groups())
+            for m in regex.finditer(data)]
+
+
+class CommandStream(threading.Thread):
+    """
+    Runs a command that prints its output in a loop (`nvidia-smi -l`, `vmstat 1`, ...) and keeps its latest
+    complete record, a record ends with the delimiter. Leading whitespace of a record is stripped.
+
+    The command is started once and restarted with exponential backoff when it exits.
+    """
+
+    def __init__(self, command, delimiter, max_record=STREAM_MAX_RECORD):
+        threading.Thread.__init__(self, name='stream {0}'.format(os.path.basename(command[0])))
+        self.daemon = True
+        self.command = command
+        self.delimiter = delimiter
+        self.max_record = max_record
+        self.lock = threading.Lock()
+        self.exit = threading.Event()
+        self.first_record = threading.Event()
+        self.proc = None
+        self.latest = None
+        self.updated = 0
+        self.restarts = 0
+        self.last_error = None
+
+    def is_started(self):
+        return self.ident is not None
+
+    def record(self):
+        """
+        :return: tuple: latest record <bytes> or None, seconds since it was received
+        """
+        with self.lock:
+            return self.latest, monotonic() - self.updated
+
+    def wait_first_record(self, timeout):
+        return self.first_record.wait(timeout)
+
+    def run(self):
+        backoff = 1
+        while not self.exit.is_set():
+            started = monotonic()
+            try:
+                self.proc = Popen(self.command, stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL)
+                self.read(self.proc.stdout.fileno())
+            except (OSError, IOError) as error:
+                self.last_error = error
+            finally:
+                self.kill()
+            if self.exit.is_set():
+                break
+            if monotonic() - started > STREAM_STABLE_AFTER:
+                backoff = 1
+            self.exit.wait(backoff)
+            backoff = min(backoff * 2, STREAM_BACKOFF_MAX)
+            self.restarts += 1
+
+    def read(self, fd):
+        delimiter, size = self.delimiter, len(self.delimiter)
+        buf = bytearray()
+        while not self.exit.is_set():
+            chunk = os.read(fd, STREAM_READ_SIZE)
+            if not chunk:
+                return
+            # the delimiter may span the chunk boundary
+            scan = max(len(buf) - size + 1, 0)
+            buf += chunk
+            end = buf.rfind(delimiter, scan)
+            if end < 0:
+                if len(buf) > self.max_record:
+                    del buf[:]
+                continue
+            start = buf.rfind(delimiter, 0, end)
+            start = start + size if start >= 0 else 0
+            end += size
+            self.publish(bytes(buf[start:end]).lstrip())
+            del buf[:end]
+
+    def publish(self, record):
+        with self.lock:
+            self.latest = record
+            self.updated = monotonic()
+        self.first_record.set()
+
+    def kill(self):
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+    def stop(self):
+        self.exit.set()
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+
+
+class ExecResult:
+    def __init__(self, previous=None):
+        self.done = threading.Event()
+        self.data = None
+        self.started = monotonic()
+        self.finished = None
+        # output of the last finished execution and when it finished, for jobs that can't wait for this one
+        self.stale, self.stale_finished = None, None
+        if previous is not None and previous.finished is not None:
+            self.stale, self.stale_finished = previous.data, previous.finished
+        elif previous is not None:
+            self.stale, self.stale_finished = previous.stale, previous.stale_finished
+
+    def stale_data(self, max_age):
+        if self.stale_finished is None or max_age is None or monotonic() - self.stale_finished >= max_age:
+            return None
+        return self.stale
+
+
+class ExecCache:
+    """
+    Output of commands shared by all jobs of the plugin, keyed by the command argv.
+
+    A result is reused if it is younger than the ttl of the asking job. Jobs asking for a command which is
+    being executed wait for that execution instead of starting another one (single-flight), so jobs running
+    the same slow command (RAID controllers CLIs) at the same time execute it once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = dict()
+
+    def get(self, key, ttl, execute, timeout=None, max_stale=None):
+        """
+        :param key: <tuple> command argv and the output stream
+        :param ttl: <float> max age of a reusable result in seconds
+        :param execute: function executing the command
+        :param timeout: <float> max time to wait for the command executed by another job, then the output of its
+        previous execution is returned. an execution running longer than that is not waited for, it is started again
+        :param max_stale: <float> max age of the previous output in seconds, None is returned if it is older
+        :return: tuple: output, whether it is a cached one
+        """
+        with self.lock:
+            now = monotonic()
+            result = self.results.get(key)
+            if result is None:
+                cached = False
+            elif result.finished is None:
+                # a hung execution is not waited for by every job forever
+                cached = timeout is None or now - result.started < timeout
+            else:
+                cached = now - result.finished < ttl
+            if not cached:
+                result = self.results[key] = ExecResult(result)
+
+        if cached:
+            if not result.done.wait(timeout):
+                return result.stale_data(max_stale), True
+            return result.data, True
+
+        try:
+            result.data = execute()
+        finally:
+            with self.lock:
+                result.finished = monotonic()
+                # failures are not cached
+                if result.data is None and self.results.get(key) is result:
+                    del self.results[key]
+            result.done.set()
+        return result.data, False
+
+
+EXEC_CACHE = ExecCache()
 
 
 class ExecutableService(SimpleService):
     def __init__(self, configuration=None, name=None):
         SimpleService.__init__(self, configuration=configuration, name=name)
         self.command = None
+        self.fork_server = self.configuration.get('fork_server', False)
+        self.exec_cache = self.configuration.get('exec_cache', True)
+        self._exec_stats = dict(executed=0, cached=0, exec_time=0)
+        self._exec_charts = False
+        # long-running command mode, modules set the record delimiter and the options making the command loop
+        self.stream_options = None
+        self.stream_delimiter = None
+        self._stream = None
 
-    def _get_raw_data(self, stderr=False, command=None):
+    def _get_raw_data(self, stderr=False, command=None, raw=False):
         """
         Get raw data from executed command
-        :return: <list>
+        :param raw: return the whole output as one <bytes> buffer, see iter_lines() and find_all()
+        :return: <list> of lines or <bytes>
         """
+        if self.stream_delimiter is not None and not stderr and command is None:
+            return self._get_stream_data(raw)
         command = command or self.command
+        if not self.exec_cache:
+            return self.__execute(stderr, command, raw)
+
+        data, cached = EXEC_CACHE.get(
+            (tuple(command), stderr, raw),
+            self.update_every * EXEC_CACHE_TTL,
+            lambda: self.__execute(stderr, command, raw),
+            self.update_every,
+            self.update_every * EXEC_STALE_MAX,
+        )
+        if cached:
+            self._exec_stats['cached'] += 1
+            self.debug("Command '{0}' output is cached".format(' '.join(command)))
+        # the output is shared with other jobs
+        if raw or data is None:
+            return data
+        return list(data)
+
+    def __execute(self, stderr, command, raw):
+        start = monotonic()
+        try:
+            return self._execute(stderr, command, raw)
+        finally:
+            self._exec_stats['executed'] += 1
+            self._exec_stats['exec_time'] += int((monotonic() - start) * 1e6)
+
+    def _execute(self, stderr, command, raw=False):
         self.debug("Executing command '{0}'".format(' '.join(command)))
+        if self.fork_server:
+            return self._get_raw_data_fork_server(stderr, command, raw)
         try:
             p = Popen(command, stdout=PIPE, stderr=PIPE)
         except Exception as error:
             self.error('Executing command {0} resulted in error: {1}'.format(command, error))
             return None
 
+        if raw:
+            out, err = p.communicate()
+            return err if stderr else out
+
         data = list()
         std = p.stderr if stderr else p.stdout
         for line in std:
@@ -40,6 +331,56 @@ class ExecutableService(SimpleService):
 
         return data
 
+    def _get_raw_data_fork_server(self, stderr, command, raw=False):
+        try:
+            _, output = FORK_SERVER.execute(command, stderr)
+        except Exception as error:
+            self.error('Executing command {0} resulted in error: {1}'.format(command, error))
+            return None
+        return output if raw else decode_lines(output)
+
+    def _get_stream_data(self, raw=False):
+        """
+        Get the latest record of the long-running command
+        :return: <list> of lines or <bytes>
+        """
+        stream = self._stream
+        if stream is None:
+            command = self.command + list(self.stream_options or [])
+            self.debug("Starting command '{0}'".format(' '.join(command)))
+            stream = self._stream = CommandStream(command, self.stream_delimiter)
+            stream.start()
+            stream.wait_first_record(max(self.update_every * 2, 5))
+
+        record, age = stream.record()
+        if record is None:
+            self.debug('no record from {0} yet, restarts: {1}, error: {2}'.format(
+                stream.command, stream.restarts, stream.last_error))
+            return None
+        if age > self.update_every * STREAM_STALE_AFTER:
+            self.debug('latest record from {0} is {1:.0f} seconds old, restarts: {2}, error: {3}'.format(
+                stream.command, age, stream.restarts, stream.last_error))
+            return None
+        return record if raw else decode_lines(record)
+
+    def create(self):
+        status = SimpleService.create(self)
+        if status and self._instrumentation:
+            self._exec_charts = True
+            self._output.write(EXEC_CHART_CREATE.format(
+                job_name=self.name,
+                update_every=self.update_every,
+                module_name=self.module_name,
+            ))
+        return status
+
+    def update(self, interval):
+        updated = SimpleService.update(self, interval)
+        stats, self._exec_stats = self._exec_stats, dict(executed=0, cached=0, exec_time=0)
+        if updated and self._exec_charts:
+            self._output.write(EXEC_CHART_UPDATE.format(job_name=self.name, since_last=interval, **stats))
+        return updated
+
     def check(self):
         """
         Parse basic configuration, check if command is whitelisted and is returning values
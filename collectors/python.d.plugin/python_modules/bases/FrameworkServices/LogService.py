@@ -5,48 +5,312 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from glob import glob
+import ctypes
+import ctypes.util
+import errno
+import struct
 import sys
 import os
 
 from bases.FrameworkServices.SimpleService import SimpleService
 
 
+PY3 = sys.version_info[0] > 2
+
+READ_CHUNK_SIZE = 64 * 1024
+DEFAULT_READ_LIMIT = 4 * 1024 * 1024
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def load_libc():
+    name = ctypes.util.find_library('c')
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class PollWatcher(object):
+    """
+    Reports a change when the path stat (inode, size, mtime) differs from the previous call.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.state = None
+
+    def watch(self, path):
+        self.path = path
+        self.state = None
+
+    def changed(self):
+        try:
+            st = os.stat(self.path)
+            state = st.st_dev, st.st_ino, st.st_size, st.st_mtime
+        except OSError:
+            state = None
+        changed = state != self.state
+        self.state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Reports a change when inotify delivered events for the file or for its directory (a new file created
+    in place of the rotated one). Costs one non-blocking read per call and no stat when the file is idle.
+    """
+    libc = None
+
+    def __init__(self):
+        if InotifyWatcher.libc is None:
+            InotifyWatcher.libc = load_libc() or False
+        if not self.libc:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.path = None
+        self.file_wd = -1
+        self.dir_wd = -1
+        self.pending = True
+
+    def add_watch(self, path, mask):
+        if not PY3:
+            path = path.encode('utf-8') if isinstance(path, unicode) else path
+        else:
+            path = os.fsencode(path)
+        return self.libc.inotify_add_watch(self.fd, path, mask)
+
+    def watch(self, path):
+        if self.file_wd >= 0:
+            self.libc.inotify_rm_watch(self.fd, self.file_wd)
+        if self.path is None or os.path.dirname(path) != os.path.dirname(self.path):
+            if self.dir_wd >= 0:
+                self.libc.inotify_rm_watch(self.fd, self.dir_wd)
+            self.dir_wd = self.add_watch(os.path.dirname(path) or '.', DIR_EVENTS)
+        self.path = path
+        self.file_wd = self.add_watch(path, FILE_EVENTS)
+        self.pending = True
+
+    def changed(self):
+        changed, self.pending = self.pending, False
+        while True:
+            try:
+                buf = os.read(self.fd, 4096)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not buf:
+                break
+            changed = changed or len(buf) >= INOTIFY_EVENT.size
+        if changed and self.file_wd < 0:
+            # the file didn't exist when the watch was requested, retry until it shows up
+            self.file_wd = self.add_watch(self.path, FILE_EVENTS)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FileTail(object):
+    """
+    Follows a file like `tail -F`. The file is kept open, rotation is detected by inode/device change of the
+    path, truncation by the file becoming smaller than the read position.
+
+    Data is read in fixed-size binary chunks and at most `read_limit` bytes are consumed per `lines()` call,
+    the rest stays in the file for the next call, so memory usage doesn't depend on the log write rate.
+    """
+
+    def __init__(self, path, read_limit=DEFAULT_READ_LIMIT, chunk_size=READ_CHUNK_SIZE, watcher=None):
+        self.path = path
+        self.read_limit = read_limit
+        self.chunk_size = min(chunk_size, read_limit)
+        self.watcher = watcher or PollWatcher()
+        self.fd = -1
+        self.id = None
+        self.position = 0
+        self.partial = b''
+        self.pending = False
+
+    def open(self, from_end=False):
+        self.close()
+        fd = os.open(self.path, os.O_RDONLY)
+        st = os.fstat(fd)
+        self.fd = fd
+        self.id = st.st_dev, st.st_ino
+        self.position = os.lseek(fd, 0, os.SEEK_END) if from_end else 0
+        self.partial = b''
+        self.pending = not from_end
+        self.watcher.watch(self.path)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+        self.fd = -1
+
+    def follow(self, path):
+        if path != self.path:
+            self.path = path
+            self.open()
+
+    def is_rotated(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_dev, st.st_ino) != self.id
+
+    def is_truncated(self):
+        return os.fstat(self.fd).st_size < self.position
+
+    def has_changes(self):
+        if not self.pending:
+            self.pending = self.watcher.changed()
+        return self.pending
+
+    def lines(self):
+        """
+        Generator of complete lines (with the trailing newline) appended since the previous call.
+        """
+        if self.fd < 0:
+            self.open()
+        if not self.has_changes():
+            return
+        if self.is_truncated():
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            self.position, self.partial = 0, b''
+
+        budget = self.read_limit
+        rotated = self.is_rotated()
+        self.pending = False
+        while True:
+            chunk = os.read(self.fd, min(self.chunk_size, budget))
+            if not chunk:
+                if not rotated:
+                    break
+                # old file is drained, continue with the new one
+                self.open()
+                rotated, self.pending = False, False
+                continue
+
+            self.position += len(chunk)
+            budget -= len(chunk)
+            for line in self.split(chunk):
+                yield line
+            if budget <= 0:
+                self.pending = True
+                break
+
+    def split(self, chunk):
+        data = self.partial + chunk if self.partial else chunk
+        end = data.rfind(b'\n') + 1
+        if not end:
+            if len(data) < self.read_limit:
+                self.partial = data
+                return ()
+            # too long line without a newline, give it away to keep memory bounded
+            end = len(data)
+        self.partial = data[end:]
+        data = data[:end]
+        if PY3:
+            data = data.decode('utf-8', 'replace')
+        lines = data.split('\n')
+        last = lines.pop()
+        return [line + '\n' for line in lines] + ([last] if last else [])
+
+    def __del__(self):
+        self.close()
+        self.watcher.close()
+
+
 class LogService(SimpleService):
     def __init__(self, configuration=None, name=None):
         SimpleService.__init__(self, configuration=configuration, name=name)
         self.log_path = self.configuration.get('path')
         self.__glob_path = self.log_path
-        self._last_position = 0
         self.__re_find = dict(current=0, run=0, maximum=60)
-        self.__open_args = {'errors': 'replace'} if sys.version_info[0] > 2 else {}
+        self.read_limit = self.configuration.get('read_limit', DEFAULT_READ_LIMIT)
+        self.use_inotify = self.configuration.get('inotify', False)
+        self._tail = None
 
-    def _get_raw_data(self):
+    def _get_raw_data(self, lazy=False):
         """
-        Get log lines since last poll
-        :return: list
+        Get log lines since last poll, at most `read_limit` bytes are read per call.
+        :param lazy: return a generator instead of a list
+        :return: list, generator, empty list if there are no new complete lines or None on error
         """
-        lines = list()
         try:
             if self.__re_find['current'] == self.__re_find['run']:
                 self._find_recent_log_file()
-            size = os.path.getsize(self.log_path)
-            if size == self._last_position:
+            tail = self._get_tail()
+            if not tail.has_changes():
                 self.__re_find['current'] += 1
-                return list()  # return empty list if nothing has changed
-            elif size < self._last_position:
-                self._last_position = 0  # read from beginning if file has shrunk
-
-            with open(self.log_path, **self.__open_args) as fp:
-                fp.seek(self._last_position)
-                for line in fp:
-                    lines.append(line)
-                self._last_position = fp.tell()
-                self.__re_find['current'] = 0
+                return list()
         except (OSError, IOError) as error:
             self.__re_find['current'] += 1
             self.error(str(error))
+            return None
 
-        return lines or None
+        self.__re_find['current'] = 0
+        if lazy:
+            return self.__read_lines(tail)
+        # a touched file or a partly written line is a change without complete lines, it is not an error
+        try:
+            return list(tail.lines())
+        except (OSError, IOError) as error:
+            self.__re_find['current'] += 1
+            self.error(str(error))
+            return None
+
+    def __read_lines(self, tail):
+        try:
+            for line in tail.lines():
+                yield line
+        except (OSError, IOError) as error:
+            self.__re_find['current'] += 1
+            self.error(str(error))
+
+    def _get_tail(self):
+        if self._tail is None:
+            self._tail = FileTail(self.log_path, read_limit=self.read_limit, watcher=self._get_watcher())
+            self._tail.open(from_end=True)
+        else:
+            self._tail.follow(self.log_path)
+        return self._tail
+
+    def _get_watcher(self):
+        if not self.use_inotify:
+            return None
+        try:
+            return InotifyWatcher()
+        except OSError as error:
+            self.warning('inotify: {0}, falling back to polling'.format(error))
+            self.use_inotify = False
+        return None
 
     def _find_recent_log_file(self):
         """
@@ -77,6 +341,10 @@ class LogService(SimpleService):
 
     def create(self):
         # set cursor at last byte of log file
-        self._last_position = os.path.getsize(self.log_path)
+        try:
+            self._get_tail()
+        except (OSError, IOError) as error:
+            self.error(str(error))
+            return False
         status = SimpleService.create(self)
         return status
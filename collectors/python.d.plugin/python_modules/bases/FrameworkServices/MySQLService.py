@@ -3,22 +3,76 @@
 # Author: Ilya Mashchenko (ilyam8)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import re
+
 from sys import exc_info
 
 try:
     import MySQLdb
+    from MySQLdb.constants import CLIENT
 
     PY_MYSQL = True
 except ImportError:
     try:
         import pymysql as MySQLdb
+        from pymysql.constants import CLIENT
 
         PY_MYSQL = True
     except ImportError:
         PY_MYSQL = False
 
+from third_party.monotonic import monotonic
+
 from bases.FrameworkServices.SimpleService import SimpleService
 
+PING_IDLE = 30  # seconds, an idle connection is pinged before use
+RECONNECT_BACKOFF_MAX = 60
+
+# client errors meaning the connection is gone
+CONNECTION_ERRORS = (
+    2002,  # CR_CONNECTION_ERROR
+    2003,  # CR_CONN_HOST_ERROR
+    2006,  # CR_SERVER_GONE_ERROR
+    2013,  # CR_SERVER_LOST
+    2055,  # CR_SERVER_LOST_EXTENDED
+    4031,  # ER_CLIENT_INTERACTION_TIMEOUT
+)
+
+# errors of a multi-statement that the same queries sent one by one don't get
+MULTI_STATEMENTS_ERRORS = (
+    1064,  # ER_PARSE_ERROR, the server doesn't split the statements
+    2014,  # CR_COMMANDS_OUT_OF_SYNC
+)
+
+RE_SELECT = re.compile(r'^\s*select\b', re.IGNORECASE)
+RE_READ_ONLY = re.compile(r'^\s*(select|show)\b', re.IGNORECASE)
+
+
+def is_connection_error(error):
+    if isinstance(error, MySQLdb.InterfaceError):
+        return True
+    code = error.args[0] if error.args else None
+    return isinstance(error, MySQLdb.OperationalError) and code in CONNECTION_ERRORS
+
+
+def is_multi_statements_error(error):
+    if isinstance(error, MySQLdb.NotSupportedError):
+        return True
+    code = error.args[0] if error.args else None
+    return code in MULTI_STATEMENTS_ERRORS
+
+
+def with_max_execution_time(query, timeout):
+    """
+    Adds the MAX_EXECUTION_TIME optimizer hint (MySQL 5.7.8+) to a SELECT, the server aborts the query
+    after the timeout. Other servers see it as a comment.
+    """
+    match = RE_SELECT.match(query)
+    if not match:
+        return query
+    return '{0} /*+ MAX_EXECUTION_TIME({1}) */{2}'.format(query[:match.end()], int(timeout * 1000),
+                                                          query[match.end():])
+
 
 class MySQLService(SimpleService):
     def __init__(self, configuration=None, name=None):
@@ -28,14 +82,77 @@ class MySQLService(SimpleService):
         self.extra_conn_properties = dict()
         self.__queries = self.configuration.get('queries', dict())
         self.queries = dict()
+        self.multi_statements = self.configuration.get('multi_statements', True)
+        self.query_timeout = self.configuration.get('query_timeout')
+        self.__last_used = 0
+        self.__backoff = 0
+        self.__next_connect = 0
+        self.__prepared = None
 
     def __connect(self):
         try:
             connection = MySQLdb.connect(connect_timeout=self.update_every, **self.__conn_properties)
         except (MySQLdb.MySQLError, TypeError, AttributeError) as error:
             return None, str(error)
-        else:
-            return connection, None
+        try:
+            # only reads are made, no transaction to commit after every run
+            connection.autocommit(True)
+        except MySQLdb.MySQLError as error:
+            connection.close()
+            return None, str(error)
+        self.__last_used = monotonic()
+        return connection, None
+
+    def __get_connection(self):
+        """
+        Persistent connection, pinged if it was idle, reconnected with exponential backoff
+        :return: connection or None
+        """
+        now = monotonic()
+        if self.__connection and now - self.__last_used > PING_IDLE:
+            try:
+                self.__connection.ping(False)
+            except MySQLdb.MySQLError as error:
+                self.__disconnect(error)
+
+        if not self.__connection:
+            if now < self.__next_connect:
+                return None
+            self.__connection, error = self.__connect()
+            if error:
+                self.__backoff = min(max(self.__backoff * 2, 1), RECONNECT_BACKOFF_MAX)
+                self.__next_connect = now + self.__backoff
+                self.debug('connection failed: {0}, next attempt in {1} sec'.format(error, self.__backoff))
+                return None
+            self.__backoff = 0
+
+        return self.__connection
+
+    def __disconnect(self, error=None):
+        if error is not None:
+            self.debug('closing connection: {0}'.format(error))
+        try:
+            self.__connection.close()
+        except (MySQLdb.MySQLError, AttributeError):
+            pass
+        self.__connection = None
+
+    def __prepare_queries(self):
+        """
+        Query texts (with the execution time hint) and the batch of all of them, built once per set of queries.
+        Only SELECT and SHOW queries are batched.
+        :return: tuple: list of (name, query), batch or None
+        """
+        key = tuple(sorted(self.queries.items()))
+        if self.__prepared is None or self.__prepared[0] != key:
+            queries = list(self.queries.items())
+            if self.query_timeout:
+                queries = [(n, with_max_execution_time(q, self.query_timeout)) for n, q in queries]
+            batch = None
+            if self.multi_statements and len(queries) > 1 and all(RE_READ_ONLY.match(q) for _, q in queries):
+                batch = ';\n'.join(q for _, q in queries)
+            self.__prepared = key, queries, batch
+        return self.__prepared[1], self.__prepared[2]
 
     def check(self):
         def get_connection_properties(conf, extra_conf):
@@ -101,6 +218,12 @@ class MySQLService(SimpleService):
         if not self.__conn_properties:
             self.error('Connection properties are missing')
             return False
+        if self.multi_statements:
+            self.__conn_properties['client_flag'] = self.__conn_properties.get('client_flag', 0) | \
+                                                    CLIENT.MULTI_STATEMENTS
+        if self.query_timeout:
+            # the job thread doesn't wait longer than that for a reply
+            self.__conn_properties.setdefault('read_timeout', self.query_timeout)
 
         # Create connection to the database
         self.__connection, error = self.__connect()
@@ -124,38 +247,78 @@ class MySQLService(SimpleService):
         Get raw data from MySQL server
         :return: dict: fetchall() or (fetchall(), description)
         """
+        connection = self.__get_connection()
+        if not connection:
+            return None
 
-        if not self.__connection:
-            self.__connection, error = self.__connect()
-            if error:
-                return None
+        queries, batch = self.__prepare_queries()
+        try:
+            raw_data, batch_error = None, None
+            if batch:
+                raw_data, batch_error = self.__execute_batch(connection, queries, batch, description)
+            if raw_data is None:
+                # the batch failure reconnects
+                count = len(self.queries)
+                raw_data = self.__execute(self.__connection, queries, description)
+                # one by one they all went through, it is the multi-statement the server doesn't accept
+                if batch_error is not None and is_multi_statements_error(batch_error) and count == len(self.queries):
+                    self.info('batched queries failed ({0}), executing them one by one from now'.format(batch_error))
+                    self.multi_statements = False
+                    self.__prepared = None
+        except (MySQLdb.MySQLError, RuntimeError, TypeError, AttributeError) as error:
+            self.__disconnect(error)
+            return None
+        self.__last_used = monotonic()
+        return raw_data or None
 
+    def __execute_batch(self, connection, queries, batch, description):
+        """
+        All queries in one round trip (multi-statement), result sets come in the queries order
+        :return: tuple: dict or None if the batch failed and the queries need to be executed one by one, the error
+        """
         raw_data = dict()
-        queries = dict(self.queries)
+        cursor = connection.cursor()
         try:
-            cursor = self.__connection.cursor()
-            for name, query in queries.items():
-                try:
-                    cursor.execute(query)
-                except (MySQLdb.ProgrammingError, MySQLdb.OperationalError) as error:
-                    if self.__is_error_critical(err_class=exc_info()[0], err_text=str(error)):
-                        cursor.close()
-                        raise RuntimeError
-                    self.error('Removed query: {name}[{query}]. Error: error'.format(name=name,
-                                                                                     query=query,
-                                                                                     error=error))
-                    self.queries.pop(name)
-                    continue
-                else:
-                    raw_data[name] = (cursor.fetchall(), cursor.description) if description else cursor.fetchall()
-            cursor.close()
-            self.__connection.commit()
-        except (MySQLdb.MySQLError, RuntimeError, TypeError, AttributeError):
-            self.__connection.close()
-            self.__connection = None
-            return None
-        else:
-            return raw_data or None
+            cursor.execute(batch)
+            for name, _ in queries:
+                raw_data[name] = (cursor.fetchall(), cursor.description) if description else cursor.fetchall()
+                cursor.nextset()
+        except (MySQLdb.ProgrammingError, MySQLdb.OperationalError, MySQLdb.NotSupportedError) as error:
+            if is_connection_error(error):
+                raise
+            # the failed statement is not known, the queries are checked one by one
+            self.debug('batched queries failed ({0}), executing them one by one'.format(error))
+            self.__disconnect()
+            self.__connection, err = self.__connect()
+            if err:
+                raise RuntimeError(err)
+            return None, error
+        finally:
+            try:
+                cursor.close()
+            except MySQLdb.MySQLError:
+                pass
+        return raw_data, None
+
+    def __execute(self, connection, queries, description):
+        raw_data = dict()
+        cursor = connection.cursor()
+        for name, query in queries:
+            try:
+                cursor.execute(query)
+            except (MySQLdb.ProgrammingError, MySQLdb.OperationalError) as error:
+                if self.__is_error_critical(err_class=exc_info()[0], err_text=str(error)):
+                    cursor.close()
+                    raise RuntimeError(error)
+                self.error('Removed query: {name}[{query}]. Error: {error}'.format(name=name,
+                                                                                   query=query,
+                                                                                   error=error))
+                self.queries.pop(name)
+                continue
+            else:
+                raw_data[name] = (cursor.fetchall(), cursor.description) if description else cursor.fetchall()
+        cursor.close()
+        return raw_data
 
     @staticmethod
     def __is_error_critical(err_class, err_text):
@@ -4,22 +4,57 @@
 # Author: Ilya Mashchenko (ilyam8)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import sys
 
 from time import sleep, time
 
 from third_party.monotonic import monotonic
 
-from bases.charts import Charts, ChartError, create_runtime_chart
-from bases.collection import safe_print
+try:
+    from collections import OrderedDict
+except ImportError:
+    from third_party.ordereddict import OrderedDict
+
+from bases.charts import Charts, ChartError, create_runtime_chart, runtime_charts
+from bases.collection import OutputBuffer, cpu_budget
 from bases.loggers import PythonDLimitedLogger
 
 RUNTIME_CHART_UPDATE = 'BEGIN netdata.runtime_{job_name} {since_last}\n' \
                        'SET run_time = {elapsed}\n' \
                        'END\n'
 
+INSTRUMENTATION_CHARTS_UPDATE = 'BEGIN netdata.runtime_{job_name}_stages {since_last}\n' \
+                                'SET raw_data = {raw_data_time}\n' \
+                                'SET parse = {parse_time}\n' \
+                                'SET charts = {charts_time}\n' \
+                                'SET emit = {emit_time}\n' \
+                                'END\n' \
+                                'BEGIN netdata.runtime_{job_name}_read {since_last}\n' \
+                                'SET read = {raw_data_bytes}\n' \
+                                'END\n' \
+                                'BEGIN netdata.runtime_{job_name}_output {since_last}\n' \
+                                'SET lines = {lines}\n' \
+                                'SET dimensions = {dimensions}\n' \
+                                'END\n' \
+                                'BEGIN netdata.runtime_{job_name}_lateness {since_last}\n' \
+                                'SET lateness = {lateness}\n' \
+                                'END\n'
+
+ADAPTIVE_CHART_UPDATE = 'BEGIN netdata.runtime_{job_name}_interval {since_last}\n' \
+                        'SET interval = {interval}\n' \
+                        'END\n'
+
 PENALTY_EVERY = 5
 MAX_PENALTY = 10 * 60  # 10 minutes
 
+ADAPTIVE_THRESHOLD = 0.8  # of the interval
+ADAPTIVE_MAX_STRETCH = 16
+# halving the interval doubles the load, the doubled load must stay below this share of the threshold,
+# so the interval doesn't flap between two values
+ADAPTIVE_HYSTERESIS = 0.5
+ADAPTIVE_PRESSURE_LOW = 0.75  # of the CPU budget
+ELAPSED_EWMA_ALPHA = 0.3
+
 
 class RuntimeCounters:
     def __init__(self, configuration):
@@ -28,6 +63,8 @@ class RuntimeCounters:
         """
         self.update_every = int(configuration.pop('update_every'))
         self.do_penalty = configuration.pop('penalty')
+        self.adaptive = configuration.pop('adaptive_update_every', False)
+        self.adaptive_threshold = float(configuration.pop('adaptive_threshold', ADAPTIVE_THRESHOLD))
 
         self.start_mono = 0
         self.start_real = 0
@@ -35,12 +72,26 @@ class RuntimeCounters:
         self.penalty = 0
         self.elapsed = 0
         self.prev_update = 0
+        self.elapsed_avg = 0
+        self.stretch = 1
 
         self.runs = 1
 
+    @property
+    def effective_update_every(self):
+        return self.update_every * self.stretch
+
     def calc_next(self):
         self.start_mono = monotonic()
-        return self.start_mono - (self.start_mono % self.update_every) + self.update_every + self.penalty
+        return self.next_run(self.start_mono)
+
+    def next_run(self, now):
+        every = self.effective_update_every
+        return now - (now % every) + every + self.penalty
+
+    def mark_start(self):
+        self.start_mono = monotonic()
+        self.start_real = time()
 
     def sleep_until_next(self):
         next_time = self.calc_next()
@@ -54,6 +105,118 @@ class RuntimeCounters:
         if self.do_penalty and self.retries % PENALTY_EVERY == 0:
             self.penalty = round(min(self.retries * self.update_every / 2, MAX_PENALTY))
 
+    def adapt(self):
+        """
+        Doubles the interval (up to ADAPTIVE_MAX_STRETCH times update_every) when runs take more than the threshold
+        of it on average or the plugin is over its CPU budget, halves it back when both are well below.
+        :return: <bool> the interval changed
+        """
+        if not self.elapsed_avg:
+            self.elapsed_avg = float(self.elapsed)
+        else:
+            self.elapsed_avg += ELAPSED_EWMA_ALPHA * (self.elapsed - self.elapsed_avg)
+        if not self.adaptive:
+            return False
+
+        load = self.elapsed_avg / 1e3 / self.effective_update_every
+        pressure = cpu_budget.pressure()
+        stretch = self.stretch
+        if load > self.adaptive_threshold or pressure > 1:
+            self.stretch = min(self.stretch * 2, ADAPTIVE_MAX_STRETCH)
+        elif self.stretch > 1 and load * 2 < self.adaptive_threshold * ADAPTIVE_HYSTERESIS \
+                and pressure < ADAPTIVE_PRESSURE_LOW:
+            self.stretch //= 2
+        return self.stretch != stretch
+
+
+class RuntimeInstrumentation:
+    """
+    Per update cycle time split and sizes, times are in microseconds.
+    """
+
+    def __init__(self):
+        self.raw_data_time = 0
+        self.raw_data_bytes = 0
+        self.get_data_time = 0
+        self.charts_time = 0
+        self.emit_time = 0
+        self.lines = 0
+        self.dimensions = 0
+        self.lateness = 0
+
+    def reset(self):
+        self.__init__()
+
+    def wrap_raw_data(self, func):
+        def wrapper(*args, **kwargs):
+            start = monotonic()
+            try:
+                data = func(*args, **kwargs)
+            finally:
+                self.raw_data_time += int((monotonic() - start) * 1e6)
+            self.raw_data_bytes += raw_data_size(data)
+            return data
+
+        return wrapper
+
+    def on_flush(self, data, elapsed):
+        self.emit_time = int(elapsed * 1e6)
+        if data:
+            self.lines = data.count('\n')
+            self.dimensions = data.count("\nSET '")
+
+    def format(self, job_name, since_last):
+        return INSTRUMENTATION_CHARTS_UPDATE.format(
+            job_name=job_name,
+            since_last=since_last,
+            raw_data_time=self.raw_data_time,
+            parse_time=max(self.get_data_time - self.raw_data_time, 0),
+            charts_time=self.charts_time,
+            emit_time=self.emit_time,
+            raw_data_bytes=self.raw_data_bytes,
+            lines=self.lines,
+            dimensions=self.dimensions,
+            lateness=self.lateness,
+        )
+
+
+class Prefetch:
+    """
+    Raw data fetched in advance on the plugin event loop (`async_io` mode).
+
+    Requests made during a run are recorded along with what is needed to make them, the plugin fetches them
+    all concurrently before the next run. Requests that were not prefetched (first run, new urls) are made
+    synchronously.
+    """
+
+    def __init__(self):
+        self.requests = OrderedDict()
+        self.results = dict()
+
+    def record(self, key, spec):
+        self.requests[key] = spec
+
+    def pop(self, key):
+        if key in self.results:
+            return True, self.results.pop(key)
+        return False, None
+
+    def take(self):
+        """
+        Requests of the previous run, results it didn't use are dropped.
+        """
+        requests, self.requests = self.requests, OrderedDict()
+        self.results.clear()
+        return requests
+
+
+def raw_data_size(data):
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    if isinstance(data, list):
+        return sum(len(v) for v in data if isinstance(v, (str, bytes)))
+    return 0
+
 
 def clean_module_name(name):
     if name.startswith('pythond_'):
@@ -83,11 +246,21 @@ class SimpleService(PythonDLimitedLogger, object):
         self.fake_name = None
 
         self._runtime_counters = RuntimeCounters(configuration=configuration)
+        self._instrumentation = None
+        if configuration.pop('instrumentation', False):
+            self._instrumentation = RuntimeInstrumentation()
+            if hasattr(self, '_get_raw_data'):
+                self._get_raw_data = self._instrumentation.wrap_raw_data(self._get_raw_data)
+        self.async_io = configuration.pop('async_io', False)
+        self._prefetch = None
+        self._output = OutputBuffer()
         self.charts = Charts(job_name=self.actual_name,
                              priority=configuration.pop('priority'),
                              cleanup=configuration.pop('chart_cleanup'),
                              get_update_every=self.get_update_every,
-                             module_name=self.module_name)
+                             module_name=self.module_name,
+                             output=self._output,
+                             skip_unchanged=configuration.pop('skip_unchanged_charts', False))
 
     def __repr__(self):
         return '<{cls_bases}: {name}>'.format(cls_bases=', '.join(c.__name__ for c in self.__class__.__bases__),
@@ -120,7 +293,23 @@ class SimpleService(PythonDLimitedLogger, object):
         self._runtime_counters.update_every = value
 
     def get_update_every(self):
-        return self.update_every
+        return self._runtime_counters.effective_update_every
+
+    def _enable_prefetch(self):
+        if sys.version_info[:2] < (3, 5):
+            self.warning('async_io requires python 3.5+, ignoring it')
+            return
+        self._prefetch = Prefetch()
+
+    def _prefetched(self, key, spec):
+        """
+        Records the request for prefetching and returns its prefetched result if there is one.
+        :return: tuple: found, result
+        """
+        if self._prefetch is None:
+            return False, None
+        self._prefetch.record(key, spec)
+        return self._prefetch.pop(key)
 
     def check(self):
         """
@@ -178,10 +367,17 @@ class SimpleService(PythonDLimitedLogger, object):
         # True if job has at least 1 chart else False
         return bool(self.charts)
 
+    def next_run(self):
+        """
+        Returns monotonic time of the next update cycle. Used by the plugin scheduler.
+        :return: <float>
+        """
+        return self._runtime_counters.next_run(monotonic())
+
     def run(self):
         """
-        Runs job in thread. Handles retries.
-        Exits when job failed or timed out.
+        Runs job in a loop. Handles retries.
+        Used when the job is run standalone, the plugin uses run_once().
         :return: None
         """
         job = self._runtime_counters
@@ -189,38 +385,77 @@ class SimpleService(PythonDLimitedLogger, object):
 
         while True:
             job.sleep_until_next()
+            self.run_once()
 
-            since = 0
-            if job.prev_update:
-                since = int((job.start_real - job.prev_update) * 1e6)
+    def run_once(self, scheduled=None):
+        """
+        Runs a single update cycle. Handles retries.
+        :param scheduled: <float>: monotonic time the cycle was scheduled at
+        :return: None
+        """
+        job = self._runtime_counters
+        job.mark_start()
 
-            try:
-                updated = self.update(interval=since)
-            except Exception as error:
-                self.error('update() unhandled exception: {error}'.format(error=error))
-                updated = False
-
-            job.runs += 1
-
-            if not updated:
-                job.handle_retries()
-            else:
-                job.elapsed = int((monotonic() - job.start_mono) * 1e3)
-                job.prev_update = job.start_real
-                job.retries, job.penalty = 0, 0
-                safe_print(RUNTIME_CHART_UPDATE.format(job_name=self.name,
-                                                       since_last=since,
-                                                       elapsed=job.elapsed))
-            self.debug('update => [{status}] (elapsed time: {elapsed}, failed retries in a row: {retries})'.format(
-                status='OK' if updated else 'FAILED',
-                elapsed=job.elapsed if updated else '-',
-                retries=job.retries))
+        stats = self._instrumentation
+        if stats:
+            stats.reset()
+            if scheduled:
+                stats.lateness = max(int((job.start_mono - scheduled) * 1e6), 0)
+
+        since = 0
+        if job.prev_update:
+            since = int((job.start_real - job.prev_update) * 1e6)
+
+        try:
+            updated = self.update(interval=since)
+        except Exception as error:
+            self.error('update() unhandled exception: {error}'.format(error=error))
+            updated = False
+
+        job.runs += 1
+
+        if not updated:
+            job.handle_retries()
+        else:
+            job.elapsed = int((monotonic() - job.start_mono) * 1e3)
+            job.prev_update = job.start_real
+            job.retries, job.penalty = 0, 0
+            self._output.write(RUNTIME_CHART_UPDATE.format(job_name=self.name,
+                                                           since_last=since,
+                                                           elapsed=job.elapsed))
+            if job.adapt():
+                self.info('update_every is {0} seconds now (average run time: {1:.0f} ms)'.format(
+                    job.effective_update_every, job.elapsed_avg))
+                self.charts.set_update_every(job.effective_update_every)
+                # the runtime charts are updated every run too
+                self._output.write(runtime_charts(self, job.effective_update_every))
+            if job.adaptive:
+                self._output.write(ADAPTIVE_CHART_UPDATE.format(job_name=self.name,
+                                                                since_last=since,
+                                                                interval=job.effective_update_every))
+        if not stats:
+            self._output.flush()
+        else:
+            start = monotonic()
+            data = self._output.flush()
+            stats.on_flush(data, monotonic() - start)
+            if updated:
+                self._output.write(stats.format(self.name, since))
+                self._output.flush()
+        self.debug('update => [{status}] (elapsed time: {elapsed}, failed retries in a row: {retries})'.format(
+            status='OK' if updated else 'FAILED',
+            elapsed=job.elapsed if updated else '-',
+            retries=job.retries))
 
     def update(self, interval):
         """
         :return:
         """
+        stats = self._instrumentation
+        start = monotonic()
         data = self.get_data()
+        if stats:
+            stats.get_data_time = int((monotonic() - start) * 1e6)
         if not data:
             self.debug('get_data() returned no data')
             return False
@@ -229,6 +464,7 @@ class SimpleService(PythonDLimitedLogger, object):
             return False
 
         updated = False
+        start = monotonic()
 
         for chart in self.charts:
             if chart.flags.obsoleted:
@@ -245,6 +481,9 @@ class SimpleService(PythonDLimitedLogger, object):
             if ok:
                 updated = True
 
+        if stats:
+            stats.charts_time = int((monotonic() - start) * 1e6)
+
         if not updated:
             self.debug('none of the charts has been updated')
 
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import errno
+import select
 import socket
 
 try:
@@ -20,6 +21,8 @@ if _TLS_SUPPORT:
     except AttributeError:
         PROTOCOL_TLS = ssl.PROTOCOL_SSLv23
 
+from third_party.monotonic import monotonic
+
 from bases.FrameworkServices.SimpleService import SimpleService
 
 
@@ -27,6 +30,15 @@ DEFAULT_CONNECT_TIMEOUT = 2.0
 DEFAULT_READ_TIMEOUT = 2.0
 DEFAULT_WRITE_TIMEOUT = 2.0
 
+RECV_BUFFER_SIZE = 64 * 1024
+RESOLVE_TTL = 60
+RECONNECT_BACKOFF_MAX = 60
+
+
+def is_overridden(obj, name, base):
+    method, base_method = getattr(type(obj), name), getattr(base, name)
+    return getattr(method, '__func__', method) is not getattr(base_method, '__func__', base_method)
+
 
 class SocketService(SimpleService):
     def __init__(self, configuration=None, name=None):
@@ -41,11 +53,20 @@ class SocketService(SimpleService):
         self.cert = None
         self.key = None
         self.__socket_config = None
+        self.__addr_info = None
+        self.__resolved_at = 0
+        self.__connect_failures = 0
+        self.__next_connect = 0
         self.__empty_request = "".encode()
+        self.__recv_buffer = memoryview(bytearray(RECV_BUFFER_SIZE))
+        self._async_conn = None
         SimpleService.__init__(self, configuration=configuration, name=name)
         self.connect_timeout = configuration.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
         self.read_timeout = configuration.get('read_timeout', DEFAULT_READ_TIMEOUT)
         self.write_timeout = configuration.get('write_timeout', DEFAULT_WRITE_TIMEOUT)
+        self.__legacy_check = is_overridden(self, '_check_raw_data', SocketService)
+        if self.async_io:
+            self._enable_prefetch()
 
     def _socket_error(self, message=None):
         if self.unix_socket is not None:
@@ -154,25 +175,36 @@ class SocketService(SimpleService):
             self._sock = None
             return False
 
+    def _resolve(self):
+        """
+        getaddrinfo() result, cached for RESOLVE_TTL seconds
+        :return: list
+        """
+        now = monotonic()
+        if self.__addr_info is None or now - self.__resolved_at > RESOLVE_TTL:
+            sock_type = socket.SOCK_DGRAM if self.dgram_socket else socket.SOCK_STREAM
+            self.__addr_info = socket.getaddrinfo(self.host, self.port, socket.AF_UNSPEC, sock_type)
+            self.__resolved_at = now
+        return self.__addr_info
+
     def _connect(self):
         """
         Recreate socket and connect to it since sockets cannot be reused after closing
         Available configurations are IPv6, IPv4 or UNIX socket
         :return:
         """
+        now = monotonic()
+        if now < self.__next_connect:
+            self.debug('reconnect backoff, next attempt in {0:.1f} sec'.format(self.__next_connect - now))
+            return
+
         try:
             if self.unix_socket is not None:
                 self._connect2unixsocket()
 
             else:
-                if self.__socket_config is not None:
-                    self._connect2socket()
-                else:
-                    if self.dgram_socket:
-                        sock_type = socket.SOCK_DGRAM
-                    else:
-                        sock_type = socket.SOCK_STREAM
-                    for res in socket.getaddrinfo(self.host, self.port, socket.AF_UNSPEC, sock_type):
+                if self.__socket_config is None or not self._connect2socket():
+                    for res in self._resolve():
                         if self._connect2socket(res):
                             break
 
@@ -180,6 +212,32 @@ class SocketService(SimpleService):
             self.error('unhandled exception during connect : {0}'.format(repr(error)))
             self._sock = None
             self.__socket_config = None
+            self.__addr_info = None
+
+        if self._sock is not None:
+            self.__connect_failures = 0
+            self.__next_connect = 0
+        else:
+            self.__connect_failures += 1
+            self.__next_connect = now + min(2 ** (self.__connect_failures - 1), RECONNECT_BACKOFF_MAX)
+
+    def _reset_backoff(self):
+        self.__connect_failures = 0
+        self.__next_connect = 0
+
+    def _is_alive(self):
+        """
+        Check if a kept alive connection is still usable: there should be nothing to read on an idle
+        connection, readable socket means the peer closed it or sent something we didn't ask for.
+        :return: boolean
+        """
+        try:
+            if self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_TYPE) == socket.SOCK_DGRAM:
+                return True
+            readable, _, _ = select.select([self._sock], [], [], 0)
+        except (select.error, ValueError, socket.error):
+            return False
+        return not readable
 
     def _disconnect(self):
         """
@@ -201,13 +259,13 @@ class SocketService(SimpleService):
         Send request.
         :return: boolean
         """
+        payload = request or self.request
         # Send request if it is needed
-        if self.request != self.__empty_request:
+        if payload != self.__empty_request:
             try:
-                self.debug('set socket write timeout to: {0}'.format(self._sock.gettimeout()))
                 self._sock.settimeout(self.write_timeout)
-                self.debug('sending request: {0}'.format(request or self.request))
-                self._sock.send(request or self.request)
+                self.debug('sending request: {0}'.format(payload))
+                self._sock.sendall(payload)
             except Exception as error:
                 self._socket_error('error sending request: {0}'.format(error))
                 self._disconnect()
@@ -222,32 +280,45 @@ class SocketService(SimpleService):
         :return: decoded str or raw bytes
         :rtype: str/bytes
         """
-        data = "" if not raw else b""
+        if raw and self.__legacy_check:
+            complete = lambda data: self._check_raw_data(bytes(data))
+        else:
+            complete = self._check_raw_bytes
+        buf = self.__recv_buffer
+        data = bytearray()
+        self.debug('receiving response')
+        try:
+            self._sock.settimeout(self.read_timeout)
+        except Exception as error:
+            self._socket_error('failed to set read timeout: {0}'.format(error))
+            self._disconnect()
+            return "" if not raw else b""
+
         while True:
-            self.debug('receiving response')
             try:
-                self.debug('set socket read timeout to: {0}'.format(self._sock.gettimeout()))
-                self._sock.settimeout(self.read_timeout)
-                buf = self._sock.recv(4096)
+                size = self._sock.recv_into(buf)
             except Exception as error:
                 self._socket_error('failed to receive response: {0}'.format(error))
                 self._disconnect()
                 break
 
-            if buf is None or len(buf) == 0:  # handle server disconnect
-                if data == "" or data == b"":
+            if not size:  # handle server disconnect
+                if not data:
                     self._socket_error('unexpectedly disconnected')
                 else:
                     self.debug('server closed the connection')
                 self._disconnect()
                 break
 
-            self.debug('received data')
-            data += buf.decode('utf-8', 'ignore') if not raw else buf
-            if self._check_raw_data(data):
+            data += buf[:size]
+            if complete(data):
                 break
 
-        self.debug(u'final response: {0}'.format(data if not raw else u'binary data'))
+        if raw:
+            self.debug('final response: {0} bytes of binary data'.format(len(data)))
+            return bytes(data)
+        data = data.decode('utf-8', 'ignore')
+        self.debug(u'final response: {0}'.format(data))
         return data
 
     def _get_raw_data(self, raw=False, request=None):
@@ -258,10 +329,16 @@ class SocketService(SimpleService):
         :return: decoded data (str) or raw data (bytes)
         :rtype: str/bytes
         """
-        if self._sock is None:
-            self._connect()
-            if self._sock is None:
-                return None
+        payload = request or self.request
+        found, data = self._prefetched(('request', payload), dict(payload=payload))
+        if found:
+            self._disconnect()
+            if data is None or raw:
+                return data
+            return data.decode('utf-8', 'ignore')
+
+        if not self._session():
+            return None
 
         # Send request if it is needed
         if not self._send(request):
@@ -274,6 +351,30 @@ class SocketService(SimpleService):
 
         return data
 
+    def _session(self):
+        """
+        Reuse the kept alive connection if it is healthy, (re)connect otherwise
+        :return: boolean
+        """
+        if self._sock is not None and not self._is_alive():
+            self.debug('kept alive connection is closed or not clean, reconnecting')
+            self._disconnect()
+
+        if self._sock is None:
+            self._connect()
+        return self._sock is not None
+
+    def _check_raw_bytes(self, data):
+        """
+        Check if all data has been gathered from socket, called after every recv with all the received data.
+        Modules that override `_check_raw_data` get it called with the decoded data.
+        :param data: bytearray
+        :return: boolean
+        """
+        if self.__legacy_check:
+            return self._check_raw_data(data.decode('utf-8', 'ignore'))
+        return bool(data)
+
     @staticmethod
     def _check_raw_data(data):
         """
@@ -288,6 +389,11 @@ class SocketService(SimpleService):
         Parse configuration data
         :return: boolean
         """
+        self._reset_backoff()
+        self._keep_alive = bool(self.configuration.get('keep_alive', self._keep_alive))
+        if self._prefetch is not None and self.dgram_socket:
+            self.warning('async_io is not supported for UDP sockets, ignoring it')
+            self._prefetch = None
         try:
             self.unix_socket = str(self.configuration['socket'])
         except (KeyError, TypeError):
@@ -4,10 +4,18 @@
 # Author: Ilya Mashchenko (ilyam8)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import json
+import ssl
+import sys
+import threading
+
 import urllib3
 
+from functools import partial
 from distutils.version import StrictVersion as version
 
+from third_party.monotonic import monotonic
+
 from bases.FrameworkServices.SimpleService import SimpleService
 
 try:
@@ -21,6 +29,16 @@ URLLIB3_MIN_REQUIRED_VERSION = '1.9'
 URLLIB3_VERSION = urllib3.__version__
 URLLIB3 = 'urllib3'
 
+POOL_MAX_HOSTS = 10  # per manager, other hosts than the one of the job url
+POOL_MAX_CONNECTIONS = 64  # requests in flight over all managers, and kept connections per host
+POOL_IDLE_TIMEOUT = 300
+POOL_EVICT_EVERY = 30
+
+TLS_SESSION_RESUMPTION = hasattr(ssl, 'SSLSession')
+
+# python 3.0-3.5 json.loads accepts only str
+JSON_FROM_BYTES = sys.version_info[0] == 2 or sys.version_info[:2] >= (3, 6)
+
 
 def version_check():
     if version(URLLIB3_VERSION) >= version(URLLIB3_MIN_REQUIRED_VERSION):
@@ -54,7 +72,13 @@ class UrlService(SimpleService):
         self.tls_ca_file = self.configuration.get('tls_ca_file')
         self.tls_key_file = self.configuration.get('tls_key_file')
         self.tls_cert_file = self.configuration.get('tls_cert_file')
+        self.shared_pool = self.configuration.get('shared_pool', True)
+        self.compression = self.configuration.get('compression', True)
+        self.conditional_requests = self.configuration.get('conditional_requests', True)
         self._manager = None
+        self._cache = dict()
+        if self.async_io:
+            self._enable_prefetch()
 
     def __make_headers(self, **header_kw):
         user = header_kw.get('user') or self.user
@@ -62,7 +86,7 @@ class UrlService(SimpleService):
         proxy_user = header_kw.get('proxy_user') or self.proxy_user
         proxy_password = header_kw.get('proxy_pass') or self.proxy_password
         custom_header = header_kw.get('header') or self.header
-        header_params = dict(keep_alive=True)
+        header_params = dict(keep_alive=True, accept_encoding=bool(self.compression))
         proxy_header_params = dict()
         if user and password:
             header_params['basic_auth'] = '{user}:{password}'.format(user=user,
@@ -109,6 +133,8 @@ class UrlService(SimpleService):
                 params['cert_reqs'] = 'CERT_NONE'
                 if is_https:
                     params['assert_hostname'] = False
+            if self.shared_pool:
+                return POOLS.get(manager, params, url_origin(url))
             return manager(**params)
         except (urllib3.exceptions.ProxySchemeUnknown, TypeError) as error:
             self.error('build_manager() error:', str(error))
@@ -120,19 +146,75 @@ class UrlService(SimpleService):
         :return: str
         """
         try:
-            response = self._do_request(url, manager, **kwargs)
+            status, data, _ = self.__fetch(url, manager, False, None, **kwargs)
         except Exception as error:
             self.error('Url: {url}. Error: {error}'.format(url=url or self.url, error=error))
             return None
 
-        if response.status == 200:
-            if isinstance(response.data, str):
-                return response.data
-            return response.data.decode(errors='ignore')
+        if status == 200:
+            if isinstance(data, str):
+                return data
+            return data.decode(errors='ignore')
         else:
-            self.debug('Url: {url}. Http response status code: {code}'.format(url=url or self.url, code=response.status))
+            self.debug('Url: {url}. Http response status code: {code}'.format(url=url or self.url, code=status))
             return None
 
+    def _get_json(self, url=None, manager=None, paths=None, **kwargs):
+        """
+        Get parsed JSON from http request. The body is parsed from bytes, without decoding it first.
+        If the server answers the resource is not modified (304) the previously parsed object is returned,
+        it is shared between calls and must not be modified.
+        :param paths: <JsonPaths> keep only these paths of the document, see bases.jsonpath
+        :return: parsed JSON or None on error
+        """
+        try:
+            status, data, cached = self.__fetch(url, manager, True, paths, **kwargs)
+        except Exception as error:
+            self.error('Url: {url}. Error: {error}'.format(url=url or self.url, error=error))
+            return None
+
+        if status != 200:
+            self.debug('Url: {url}. Http response status code: {code}'.format(url=url or self.url, code=status))
+            return None
+        if cached is not None and cached.data is None and cached.paths is paths:
+            return cached.parsed
+        try:
+            parsed = paths.extract(data) if paths is not None else loads_json(data)
+        except ValueError as error:
+            self.error('Url: {url}. Invalid JSON: {error}'.format(url=url or self.url, error=error))
+            return None
+        if cached is not None:
+            # the raw body is not needed anymore, the next 304 gets the parsed object
+            cached.parsed, cached.paths, cached.data = parsed, paths, None
+        return parsed
+
+    def __fetch(self, url, manager, parsed, paths, **kwargs):
+        """
+        Make a conditional request if there is a cached body (or parsed body with the same paths) of the url.
+        :return: tuple: status, body, CachedBody if the response can be cached or is the cached one
+        """
+        url = url or self.url
+        manager = manager or self._manager
+        conditional = self.conditional_requests and self._prefetch is None and not kwargs
+        cached = self._cache.get(url) if conditional else None
+        if cached is not None and (cached.data is not None or parsed and cached.paths is paths):
+            kwargs['headers'] = cached.headers(manager.headers)
+        else:
+            cached = None
+
+        response = self._do_request(url, manager, **kwargs)
+
+        if response.status == 304 and cached is not None:
+            return 200, cached.data, cached
+        if response.status == 200 and conditional:
+            cached = CachedBody.from_response(response)
+            if cached is not None:
+                self._cache[url] = cached
+            else:
+                self._cache.pop(url, None)
+            return response.status, response.data, cached
+        return response.status, response.data, None
+
     def _get_raw_data_with_status(self, url=None, manager=None, retries=1, redirect=True, **kwargs):
         """
         Get status and response body content from http request. Does not catch exceptions
@@ -151,22 +233,38 @@ class UrlService(SimpleService):
         """
         url = url or self.url
         manager = manager or self._manager
+        if self._prefetch is not None and not kwargs:
+            # prefetched requests are made by the same client, on the event loop threads
+            key = ('http', self.method, url, self.body, retries, redirect, id(manager))
+            found, response = self._prefetched(key, dict(request=partial(self.__request, url, manager, retries,
+                                                                         redirect)))
+            if found:
+                if isinstance(response, Exception):
+                    raise response
+                return response
+        return self.__request(url, manager, retries, redirect, **kwargs)
+
+    def __request(self, url, manager, retries, redirect, **kwargs):
         retry = urllib3.Retry(retries)
         if hasattr(retry, 'respect_retry_after_header'):
             retry.respect_retry_after_header = bool(self.respect_retry_after_header)
 
         if self.body:
             kwargs['body'] = self.body
+        headers = kwargs.pop('headers', None) or manager.headers
 
-        response = manager.request(
-            method=self.method,
-            url=url,
-            timeout=self.request_timeout,
-            retries=retry,
-            headers=manager.headers,
-            redirect=redirect,
-            **kwargs
-        )
+        POOLS.evict_idle()
+        with POOLS.slot(self.request_timeout):
+            response = manager.request(
+                method=self.method,
+                url=url,
+                timeout=self.request_timeout,
+                retries=retry,
+                headers=headers,
+                redirect=redirect,
+                **kwargs
+            )
+        manager.last_used = monotonic()
         return response
 
     def check(self):
@@ -194,6 +292,203 @@ class UrlService(SimpleService):
         return False
 
 
+class SessionSSLSocket(ssl.SSLSocket if TLS_SESSION_RESUMPTION else object):
+    def close(self):
+        # TLSv1.3 session tickets arrive after the handshake, the session is saved when the connection is done
+        if getattr(self, 'session_key', None) is not None and self._sslobj is not None:
+            self.context.save_session(self.session_key, self.session)
+        ssl.SSLSocket.close(self)
+
+
+class ResumingSSLContext(ssl.SSLContext if TLS_SESSION_RESUMPTION else object):
+    """
+    Offers the session of the previous connection to the same host on every new connection,
+    so reconnects to a host skip the full TLS handshake.
+    """
+    sslsocket_class = SessionSSLSocket
+
+    def __init__(self, *args, **kwargs):
+        self.options |= getattr(ssl, 'OP_NO_SSLv2', 0) | getattr(ssl, 'OP_NO_SSLv3', 0)
+        self.options |= getattr(ssl, 'OP_NO_COMPRESSION', 0)
+        # urllib3 matches hostnames itself
+        self.check_hostname = False
+        self.lock = threading.Lock()
+        self.sessions = dict()
+
+    def save_session(self, key, session):
+        if session is None:
+            return
+        with self.lock:
+            self.sessions[key] = session
+
+    def wrap_socket(self, sock, server_hostname=None, **kwargs):
+        key = server_hostname, sock.getpeername()[1]
+        with self.lock:
+            session = self.sessions.pop(key, None)
+        try:
+            ssl_sock = ssl.SSLContext.wrap_socket(self, sock, server_hostname=server_hostname, session=session,
+                                                  **kwargs)
+        except ssl.SSLError:
+            if session is None:
+                raise
+            ssl_sock = ssl.SSLContext.wrap_socket(self, sock, server_hostname=server_hostname, **kwargs)
+        ssl_sock.session_key = key
+        self.save_session(key, ssl_sock.session)
+        return ssl_sock
+
+
+def resuming_ssl_context(params):
+    """
+    :param params: <dict> urllib3 manager parameters
+    :return: <ResumingSSLContext>
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    if params.get('cert_reqs') != 'CERT_NONE' and not (params.get('ca_certs') or params.get('ca_cert_dir')):
+        # urllib3, except the bundled copy, loads the system CA certificates only into contexts it creates
+        context.load_default_certs()
+    return context
+
+
+def url_origin(url):
+    """
+    :param url: <str>
+    :return: <tuple> scheme, host and port of the url
+    """
+    parsed = urllib3.util.parse_url(url)
+    return parsed.scheme, parsed.host, parsed.port
+
+
+class PoolRegistry:
+    """
+    urllib3 managers shared by all UrlService jobs with the same connection parameters (proxy, TLS, auth
+    and headers) polling the same host (scheme, host, port). Jobs polling the same host reuse its connections
+    and TLS sessions instead of opening their own. A manager keeps as many connections to the host as were in
+    use at once, up to the requests in flight cap, so concurrent jobs don't throw connections away.
+
+    The number of requests in flight over all managers is capped, managers idle for POOL_IDLE_TIMEOUT
+    seconds are dropped from the registry.
+    """
+
+    def __init__(self, max_connections=POOL_MAX_CONNECTIONS, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.lock = threading.Lock()
+        self.managers = dict()
+        self.idle_timeout = idle_timeout
+        self.last_evict = monotonic()
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    @staticmethod
+    def key(cls, params, origin=None):
+        # header values come from the job configuration, they are sent as strings
+        return cls, origin, tuple(sorted(
+            (k, tuple(sorted((str(hk), str(hv)) for hk, hv in v.items())) if isinstance(v, dict) else v)
+            for k, v in params.items()))
+
+    def get(self, cls, params, origin=None):
+        """
+        :param cls: urllib3.PoolManager or urllib3.ProxyManager
+        :param params: <dict> manager parameters
+        :param origin: <tuple> scheme, host and port the job polls
+        :return: manager, a private one if the parameters can't be shared
+        """
+        try:
+            key = self.key(cls, params, origin)
+            hash(key)
+        except TypeError:
+            return cls(**params)
+        with self.lock:
+            manager = self.managers.get(key)
+            if manager is None:
+                params = dict(params, num_pools=POOL_MAX_HOSTS, maxsize=POOL_MAX_CONNECTIONS)
+                if TLS_SESSION_RESUMPTION:
+                    params['ssl_context'] = resuming_ssl_context(params)
+                manager = self.managers[key] = cls(**params)
+                manager.last_used = monotonic()
+            return manager
+
+    def evict_idle(self):
+        """
+        Forgets managers idle for idle_timeout seconds. A job holding one keeps using it, it can't be closed
+        under it. The connections of a manager no job holds are closed when it is garbage collected.
+        """
+        now = monotonic()
+        if now - self.last_evict < POOL_EVICT_EVERY:
+            return
+        with self.lock:
+            self.last_evict = now
+            for key, manager in list(self.managers.items()):
+                if now - manager.last_used > self.idle_timeout:
+                    del self.managers[key]
+
+    def slot(self, timeout):
+        return PoolSlot(self, timeout)
+
+    def acquire(self, timeout):
+        deadline = monotonic() + timeout
+        with self.cond:
+            while self.in_flight >= self.max_connections:
+                left = deadline - monotonic()
+                if left <= 0:
+                    raise urllib3.exceptions.PoolError(None, 'too many connections in flight')
+                self.cond.wait(left)
+            self.in_flight += 1
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+
+
+class PoolSlot:
+    def __init__(self, registry, timeout):
+        self.registry = registry
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.registry.acquire(self.timeout)
+
+    def __exit__(self, *args):
+        self.registry.release()
+
+
+POOLS = PoolRegistry()
+
+
+class CachedBody:
+    """
+    Last 200 response body of a url and its validators, sent back as If-None-Match/If-Modified-Since.
+    """
+
+    def __init__(self, etag, last_modified, data):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.data = data
+        self.parsed = None
+        self.paths = None
+
+    @classmethod
+    def from_response(cls, response):
+        etag, last_modified = response.headers.get('etag'), response.headers.get('last-modified')
+        if not (etag or last_modified):
+            return None
+        return cls(etag, last_modified, response.data)
+
+    def headers(self, headers):
+        headers = dict(headers)
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def loads_json(data):
+    if not JSON_FROM_BYTES and isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
 def skip_tls_verify(is_https, tls_verify, tls_ca_file):
     # default 'tls_verify' value is None
     # logic is:
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Description: asyncio transport for SocketService and UrlService jobs (python 3.5+)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import ssl
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+RECV_SIZE = 64 * 1024
+# threads for blocking HTTP requests, they are started on demand. requests in flight are also bounded by
+# the UrlService connection slots
+EXECUTOR_MAX_WORKERS = 64
+
+
+class EventLoop:
+    """
+    Event loop running in its own thread. Jobs I/O is prefetched on it, all requests of all jobs
+    concurrently, the job run itself (parsing, charts) is up to the callback. HTTP requests are made by
+    the UrlService client (proxies, retries, shared pools) on the loop executor threads.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=EXECUTOR_MAX_WORKERS))
+        self.thread = threading.Thread(target=self.run, name='asyncio')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def prefetch(self, service, callback):
+        asyncio.run_coroutine_threadsafe(prefetch(service, callback), self.loop)
+
+
+async def prefetch(service, callback):
+    try:
+        requests = service._prefetch.take()
+        sockets = [(k, s) for k, s in requests.items() if k[0] != 'http']
+        urls = [(k, s) for k, s in requests.items() if k[0] == 'http']
+        # socket requests share the job connection, they are made one after another
+        tasks = [fetch_sockets(service, sockets)] + [fetch_url(service, k, s) for k, s in urls]
+        await asyncio.gather(*tasks)
+    except Exception as error:
+        service.error('prefetch failed : {0}'.format(repr(error)))
+    finally:
+        callback()
+
+
+async def fetch_sockets(service, requests):
+    for key, spec in requests:
+        service._prefetch.results[key] = await socket_request(service, spec)
+
+
+async def fetch_url(service, key, spec):
+    loop = asyncio.get_event_loop()
+    try:
+        service._prefetch.results[key] = await loop.run_in_executor(None, spec['request'])
+    except Exception as error:
+        service._prefetch.results[key] = error
+
+
+def socket_endpoint(service):
+    if service.unix_socket is not None:
+        return 'unix socket "{0}"'.format(service.unix_socket)
+    return 'socket to "{0}" port {1}'.format(service.host, service.port)
+
+
+def close_connection(conn):
+    if conn is not None:
+        conn[1].close()
+
+
+async def open_socket(service):
+    if service.unix_socket is not None:
+        return await asyncio.open_unix_connection(service.unix_socket)
+    ctx = None
+    if service.tls:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        if service.cert:
+            ctx.load_cert_chain(service.cert, service.key)
+    return await asyncio.open_connection(service.host, service.port, ssl=ctx)
+
+
+async def socket_request(service, spec):
+    """
+    :return: bytes or None on error
+    """
+    conn, service._async_conn = service._async_conn, None
+    if conn is not None and conn[0].at_eof():
+        close_connection(conn)
+        conn = None
+
+    complete = service._check_raw_bytes
+    data = bytearray()
+    try:
+        if conn is None:
+            conn = await asyncio.wait_for(open_socket(service), service.connect_timeout)
+        reader, writer = conn
+        if spec['payload']:
+            writer.write(spec['payload'])
+            await asyncio.wait_for(writer.drain(), service.write_timeout)
+        while True:
+            chunk = await asyncio.wait_for(reader.read(RECV_SIZE), service.read_timeout)
+            if not chunk:
+                close_connection(conn)
+                conn = None
+                if not data:
+                    service.error('{0}: unexpectedly disconnected'.format(socket_endpoint(service)))
+                    return None
+                break
+            data += chunk
+            if complete(data):
+                break
+    except (OSError, asyncio.TimeoutError) as error:
+        service.error('{0}: {1}'.format(socket_endpoint(service), repr(error)))
+        close_connection(conn)
+        return None
+
+    if service._keep_alive:
+        service._async_conn = conn
+    else:
+        close_connection(conn)
+    return bytes(data)
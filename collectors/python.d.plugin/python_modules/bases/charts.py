@@ -3,7 +3,12 @@
 # Author: Ilya Mashchenko (ilyam8)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from bases.collection import safe_print
+from bases.collection import UnbufferedOutput
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from third_party.ordereddict import OrderedDict
 
 CHART_PARAMS = ['type', 'id', 'name', 'title', 'units', 'family', 'context', 'chart_type', 'hidden']
 DIMENSION_PARAMS = ['id', 'name', 'algorithm', 'multiplier', 'divisor', 'hidden']
@@ -20,13 +25,58 @@ CHART_OBSOLETE = "CHART {type}.{id} '{name}' '{title}' '{units}' '{family}' '{co
 
 DIMENSION_CREATE = "DIMENSION '{id}' '{name}' {algorithm} {multiplier} {divisor} '{hidden} {obsolete}'\n"
 DIMENSION_SET = "SET '{id}' = {value}\n"
+DIMENSION_SET_PREFIX = "SET '{id}' = "
 
 CHART_VARIABLE_SET = "VARIABLE CHART '{id}' = {value}\n"
+CHART_VARIABLE_SET_PREFIX = "VARIABLE CHART '{id}' = "
 
 RUNTIME_CHART_CREATE = "CHART netdata.runtime_{job_name} '' 'Execution time' 'ms' 'python.d' " \
                        "netdata.pythond_runtime line 145000 {update_every} '' 'python.d.plugin' '{module_name}'\n" \
                        "DIMENSION run_time 'run time' absolute 1 1\n"
 
+ADAPTIVE_CHART_CREATE = "CHART netdata.runtime_{job_name}_interval '' 'Effective update interval' 'seconds' " \
+                        "'python.d' netdata.pythond_runtime_interval line 145000 {update_every} '' " \
+                        "'python.d.plugin' '{module_name}'\n" \
+                        "DIMENSION interval 'interval' absolute 1 1\n"
+
+INSTRUMENTATION_CHARTS_CREATE = "CHART netdata.runtime_{job_name}_stages '' 'Execution time by stage' 'ms' " \
+                                "'python.d' netdata.pythond_runtime_stages stacked 145000 {update_every} '' " \
+                                "'python.d.plugin' '{module_name}'\n" \
+                                "DIMENSION raw_data 'raw data' absolute 1 1000\n" \
+                                "DIMENSION parse 'parse' absolute 1 1000\n" \
+                                "DIMENSION charts 'charts' absolute 1 1000\n" \
+                                "DIMENSION emit 'emit' absolute 1 1000\n" \
+                                "CHART netdata.runtime_{job_name}_read '' 'Raw data read' 'KiB' 'python.d' " \
+                                "netdata.pythond_runtime_read line 145000 {update_every} '' " \
+                                "'python.d.plugin' '{module_name}'\n" \
+                                "DIMENSION read 'read' absolute 1 1024\n" \
+                                "CHART netdata.runtime_{job_name}_output '' 'Output' 'lines' 'python.d' " \
+                                "netdata.pythond_runtime_output line 145000 {update_every} '' " \
+                                "'python.d.plugin' '{module_name}'\n" \
+                                "DIMENSION lines 'lines' absolute 1 1\n" \
+                                "DIMENSION dimensions 'dimensions' absolute 1 1\n" \
+                                "CHART netdata.runtime_{job_name}_lateness '' 'Scheduling lateness' 'ms' 'python.d' " \
+                                "netdata.pythond_runtime_lateness line 145000 {update_every} '' " \
+                                "'python.d.plugin' '{module_name}'\n" \
+                                "DIMENSION lateness 'lateness' absolute 1 1000\n"
+
+
+def runtime_charts(service, update_every):
+    """
+    Definitions of the job runtime charts, they are updated every job run.
+
+    :param service: job
+    :param update_every: <int>
+    :return: <str>
+    """
+    params = dict(job_name=service.name, update_every=update_every, module_name=service.module_name)
+    charts = RUNTIME_CHART_CREATE.format(**params)
+    if service._runtime_counters.adaptive:
+        charts += ADAPTIVE_CHART_CREATE.format(**params)
+    if service._instrumentation:
+        charts += INSTRUMENTATION_CHARTS_CREATE.format(**params)
+    return charts
+
 
 def create_runtime_chart(func):
     """
@@ -42,18 +92,29 @@ def create_runtime_chart(func):
 
     def wrapper(*args, **kwargs):
         self = args[0]
-        chart = RUNTIME_CHART_CREATE.format(
-            job_name=self.name,
-            update_every=self._runtime_counters.update_every,
-            module_name=self.module_name,
-        )
-        safe_print(chart)
-        ok = func(*args, **kwargs)
+        self._output.write(runtime_charts(self, self._runtime_counters.update_every))
+        try:
+            ok = func(*args, **kwargs)
+        finally:
+            self._output.flush()
         return ok
 
     return wrapper
 
 
+class ReadOnlyParams(dict):
+    """
+    'params' of Chart, Dimension and ChartVariable. They are built from the object attributes, so changing them
+    would have no effect, the attributes must be set instead.
+    """
+
+    def read_only(self, *args, **kwargs):
+        raise TypeError('params are read-only, set the attribute instead')
+
+    __setitem__ = __delitem__ = read_only
+    clear = pop = popitem = setdefault = update = read_only
+
+
 class ChartError(Exception):
     """Base-class for all exceptions raised by this module"""
 
@@ -77,17 +138,23 @@ class Charts:
     Chart is a instance of Chart class.
     Charts adding must be done using Charts.add_chart() method only"""
 
-    def __init__(self, job_name, priority, cleanup, get_update_every, module_name):
+    def __init__(self, job_name, priority, cleanup, get_update_every, module_name, output=None,
+                 skip_unchanged=False):
         """
         :param job_name: <bound method>
         :param priority: <int>
         :param get_update_every: <bound method>
+        :param output: <OutputBuffer>
+        :param skip_unchanged: <int>: how many updates in a row of a chart whose values did not change since the last
+        update are not sent, True is 1
         """
         self.job_name = job_name
         self.priority = priority
         self.cleanup = cleanup
         self.get_update_every = get_update_every
         self.module_name = module_name
+        self.output = output or UnbufferedOutput()
+        self.skip_unchanged = int(skip_unchanged)
         self.charts = dict()
 
     def __len__(self):
@@ -117,6 +184,17 @@ class Charts:
     def __nonzero__(self):
         return self.__bool__()
 
+    def set_update_every(self, update_every):
+        """
+        Redefines the charts with a new update_every, netdata then expects their updates at that interval.
+        :param update_every: <int>
+        :return:
+        """
+        for chart in self:
+            chart.update_every = update_every
+            if not chart.flags.obsoleted:
+                chart.refresh()
+
     def add_chart(self, params):
         """
         Create Chart instance and add it to the dict
@@ -128,9 +206,11 @@ class Charts:
         params = [self.job_name()] + params
         new_chart = Chart(params)
 
-        new_chart.params['update_every'] = self.get_update_every()
-        new_chart.params['priority'] = self.priority
-        new_chart.params['module_name'] = self.module_name
+        new_chart.update_every = self.get_update_every()
+        new_chart.priority = self.priority
+        new_chart.module_name = self.module_name
+        new_chart.output = self.output
+        new_chart.skip_unchanged = self.skip_unchanged
 
         self.priority += 1
         self.charts[new_chart.id] = new_chart
@@ -141,9 +221,34 @@ class Charts:
         return [chart.id for chart in self if not chart.flags.obsoleted]
 
 
-class Chart:
+class Chart(object):
     """Represent a chart"""
 
+    __slots__ = (
+        'type',
+        'id',
+        'name',
+        'display_name',
+        'title',
+        'units',
+        'family',
+        'context',
+        'chart_type',
+        'hidden',
+        'priority',
+        'update_every',
+        'module_name',
+        'variables',
+        'flags',
+        'penalty',
+        'output',
+        'skip_unchanged',
+        'skipped',
+        'last_values',
+        'compiled',
+        '_dimensions',
+    )
+
     def __init__(self, params):
         """
         :param params: <list>
@@ -153,25 +258,55 @@ class Chart:
         if not len(params) >= 8:
             raise ItemValueError("invalid value for 'chart', must be {0}".format(CHART_PARAMS))
 
-        self.params = dict(zip(CHART_PARAMS, (p or str() for p in params)))
-        self.name = '{type}.{id}'.format(type=self.params['type'],
-                                         id=self.params['id'])
-        if self.params.get('chart_type') not in CHART_TYPES:
-            self.params['chart_type'] = 'absolute'
-        hidden = str(self.params.get('hidden', ''))
-        self.params['hidden'] = 'hidden' if hidden == 'hidden' else ''
-
-        self.dimensions = list()
+        params = dict(zip(CHART_PARAMS, (p or str() for p in params)))
+        self.type = params['type']
+        self.id = params['id']
+        self.name = '{type}.{id}'.format(type=self.type, id=self.id)
+        self.display_name = params['name']
+        self.title = params['title']
+        self.units = params['units']
+        self.family = params['family']
+        self.context = params['context']
+        self.chart_type = params['chart_type'] if params['chart_type'] in CHART_TYPES else 'absolute'
+        self.hidden = 'hidden' if str(params.get('hidden', '')) == 'hidden' else ''
+        self.priority = None
+        self.update_every = None
+        self.module_name = None
+
+        self._dimensions = OrderedDict()
         self.variables = set()
         self.flags = ChartFlags()
         self.penalty = 0
+        self.output = UnbufferedOutput()
+        self.skip_unchanged = 0
+        self.skipped = 0
+        self.last_values = None
+        self.compiled = None
+
+    @property
+    def params(self):
+        return ReadOnlyParams(
+            type=self.type,
+            id=self.id,
+            name=self.display_name,
+            title=self.title,
+            units=self.units,
+            family=self.family,
+            context=self.context,
+            chart_type=self.chart_type,
+            hidden=self.hidden,
+            priority=self.priority,
+            update_every=self.update_every,
+            module_name=self.module_name,
+        )
 
-    def __getattr__(self, item):
-        try:
-            return self.params[item]
-        except KeyError:
-            raise AttributeError("'{instance}' has no attribute '{attr}'".format(instance=repr(self),
-                                                                                 attr=item))
+    @property
+    def dimensions(self):
+        """
+        Read-only, dimensions are added and removed by add_dimension() and del_dimension().
+        :return: <tuple>
+        """
+        return tuple(self._dimensions.values())
 
     def __repr__(self):
         return 'Chart({0})'.format(self.id)
@@ -180,10 +315,12 @@ class Chart:
         return self.id
 
     def __iter__(self):
-        return iter(self.dimensions)
+        return iter(self._dimensions.values())
 
     def __contains__(self, item):
-        return item in [dimension.id for dimension in self.dimensions]
+        if isinstance(item, Dimension):
+            item = item.id
+        return item in self._dimensions
 
     def add_variable(self, variable):
         """
@@ -191,6 +328,7 @@ class Chart:
         :return:
         """
         self.variables.add(ChartVariable(variable))
+        self.compiled = None
 
     def add_dimension(self, dimension):
         """
@@ -199,30 +337,30 @@ class Chart:
         """
         dim = Dimension(dimension)
 
-        if dim.id in self:
+        if dim.id in self._dimensions:
             raise DuplicateItemError("'{dimension}' already in '{chart}' dimensions".format(dimension=dim.id,
                                                                                             chart=self.name))
         self.refresh()
-        self.dimensions.append(dim)
+        self._dimensions[dim.id] = dim
+        self.compiled = None
         return dim
 
     def del_dimension(self, dimension_id, hide=True):
-        if dimension_id not in self:
+        dimension = self._dimensions.get(dimension_id)
+        if dimension is None:
             return
-        idx = self.dimensions.index(dimension_id)
-        dimension = self.dimensions[idx]
         if hide:
-            dimension.params['hidden'] = 'hidden'
-        dimension.params['obsolete'] = 'obsolete'
+            dimension.hidden = 'hidden'
+        dimension.obsolete = 'obsolete'
         self.create()
-        self.dimensions.remove(dimension)
+        del self._dimensions[dimension_id]
+        self.compiled = None
 
     def hide_dimension(self, dimension_id, reverse=False):
-        if dimension_id not in self:
+        dimension = self._dimensions.get(dimension_id)
+        if dimension is None:
             return
-        idx = self.dimensions.index(dimension_id)
-        dimension = self.dimensions[idx]
-        dimension.params['hidden'] = 'hidden' if not reverse else str()
+        dimension.hidden = 'hidden' if not reverse else str()
         self.refresh()
 
     def create(self):
@@ -230,41 +368,59 @@ class Chart:
         :return:
         """
         chart = CHART_CREATE.format(**self.params)
-        dimensions = ''.join([dimension.create() for dimension in self.dimensions])
+        dimensions = ''.join([dimension.create() for dimension in self._dimensions.values()])
         variables = ''.join([var.set(var.value) for var in self.variables if var])
 
         self.flags.push = False
         self.flags.created = True
 
-        safe_print(chart + dimensions + variables)
+        self.output.write(chart, dimensions, variables)
+
+    def compile(self):
+        """
+        Prebuilds the parts of the update message that do not depend on collected values.
+        Must be called again after dimensions or variables change.
+        :return:
+        """
+        self.compiled = (
+            [(dim_id, DIMENSION_SET_PREFIX.format(id=dim_id)) for dim_id in self._dimensions],
+            [(var.id, CHART_VARIABLE_SET_PREFIX.format(id=var.id)) for var in self.variables],
+            'BEGIN {type}.{id} '.format(type=self.type, id=self.id),
+        )
 
     def can_be_updated(self, data):
-        for dim in self.dimensions:
+        for dim in self._dimensions.values():
             if dim.get_value(data) is not None:
                 return True
         return False
 
     def update(self, data, interval):
-        updated_dimensions, updated_variables = str(), str()
-
-        for dim in self.dimensions:
-            value = dim.get_value(data)
-            if value is not None:
-                updated_dimensions += dim.set(value)
+        if self.compiled is None:
+            self.compile()
+        dimensions, variables, chart_begin = self.compiled
 
-        for var in self.variables:
-            value = var.get_value(data)
-            if value is not None:
-                updated_variables += var.set(value)
+        updated_dimensions = collect_values(dimensions, data)
 
         if updated_dimensions:
+            updated_variables = collect_values(variables, data)
+            if self.skip_unchanged:
+                values = (updated_dimensions, updated_variables)
+                # netdata interpolates over a few missed updates only, the chart is sent again before it shows a gap
+                if not self.flags.push and values == self.last_values and self.skipped < self.skip_unchanged:
+                    # netdata computes the interval itself on the next sent update
+                    self.skipped += 1
+                    self.flags.updated = False
+                    self.penalty = 0
+                    return True
+                self.last_values = values
+                self.skipped = 0
+
             since_last = interval if self.flags.updated else 0
 
             if self.flags.push:
                 self.create()
 
-            chart_begin = CHART_BEGIN.format(type=self.type, id=self.id, since_last=since_last)
-            safe_print(chart_begin, updated_dimensions, updated_variables, 'END\n')
+            self.output.write(chart_begin, str(since_last), '\n', updated_dimensions, updated_variables, 'END\n')
 
             self.flags.updated = True
             self.penalty = 0
@@ -277,7 +433,7 @@ class Chart:
     def obsolete(self):
         self.flags.obsoleted = True
         if self.flags.created:
-            safe_print(CHART_OBSOLETE.format(**self.params))
+            self.output.write(CHART_OBSOLETE.format(**self.params))
 
     def refresh(self):
         self.penalty = 0
@@ -285,9 +441,39 @@ class Chart:
         self.flags.obsoleted = False
 
 
-class Dimension:
+def collect_values(compiled, data):
+    """
+    :param compiled: <list>: (id, SET line prefix) pairs
+    :param data: <dict>
+    :return: <str>: SET lines for all ids that have a value in data
+    """
+    get = data.get
+    lines = list()
+    for item_id, prefix in compiled:
+        value = get(item_id)
+        if value is None:
+            continue
+        try:
+            value = int(value)
+        except TypeError:
+            continue
+        lines.append(prefix + str(value) + '\n')
+    return ''.join(lines)
+
+
+class Dimension(object):
     """Represent a dimension"""
 
+    __slots__ = (
+        'id',
+        'name',
+        'algorithm',
+        'multiplier',
+        'divisor',
+        'hidden',
+        'obsolete',
+    )
+
     def __init__(self, params):
         """
         :param params: <list>
@@ -297,24 +483,26 @@ class Dimension:
         if not params:
             raise ItemValueError("invalid value for 'dimension', must be {0}".format(DIMENSION_PARAMS))
 
-        self.params = dict(zip(DIMENSION_PARAMS, (p or str() for p in params)))
-        self.params['name'] = self.params.get('name') or self.params['id']
-
-        if self.params.get('algorithm') not in DIMENSION_ALGORITHMS:
-            self.params['algorithm'] = 'absolute'
-        if not isinstance(self.params.get('multiplier'), int):
-            self.params['multiplier'] = 1
-        if not isinstance(self.params.get('divisor'), int):
-            self.params['divisor'] = 1
-        self.params.setdefault('hidden', '')
-        self.params.setdefault('obsolete', '')
-
-    def __getattr__(self, item):
-        try:
-            return self.params[item]
-        except KeyError:
-            raise AttributeError("'{instance}' has no attribute '{attr}'".format(instance=repr(self),
-                                                                                 attr=item))
+        params = dict(zip(DIMENSION_PARAMS, (p or str() for p in params)))
+        self.id = params['id']
+        self.name = params.get('name') or self.id
+        self.algorithm = params.get('algorithm') if params.get('algorithm') in DIMENSION_ALGORITHMS else 'absolute'
+        self.multiplier = params.get('multiplier') if isinstance(params.get('multiplier'), int) else 1
+        self.divisor = params.get('divisor') if isinstance(params.get('divisor'), int) else 1
+        self.hidden = params.get('hidden', '')
+        self.obsolete = ''
+
+    @property
+    def params(self):
+        return ReadOnlyParams(
+            id=self.id,
+            name=self.name,
+            algorithm=self.algorithm,
+            multiplier=self.multiplier,
+            divisor=self.divisor,
+            hidden=self.hidden,
+            obsolete=self.obsolete,
+        )
 
     def __repr__(self):
         return 'Dimension({0})'.format(self.id)
@@ -331,7 +519,7 @@ class Dimension:
         return not self == other
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash(self.id)
 
     def create(self):
         return DIMENSION_CREATE.format(**self.params)
@@ -351,9 +539,14 @@ class Dimension:
             return None
 
 
-class ChartVariable:
+class ChartVariable(object):
     """Represent a chart variable"""
 
+    __slots__ = (
+        'id',
+        'value',
+    )
+
     def __init__(self, params):
         """
         :param params: <list>
@@ -363,15 +556,13 @@ class ChartVariable:
         if not params:
             raise ItemValueError("invalid value for 'variable' must be: {0}".format(VARIABLE_PARAMS))
 
-        self.params = dict(zip(VARIABLE_PARAMS, params))
-        self.params.setdefault('value', None)
+        params = dict(zip(VARIABLE_PARAMS, params))
+        self.id = params['id']
+        self.value = params.get('value')
 
-    def __getattr__(self, item):
-        try:
-            return self.params[item]
-        except KeyError:
-            raise AttributeError("'{instance}' has no attribute '{attr}'".format(instance=repr(self),
-                                                                                 attr=item))
+    @property
+    def params(self):
+        return ReadOnlyParams(id=self.id, value=self.value)
 
     def __bool__(self):
         return self.value is not None
@@ -394,7 +585,7 @@ class ChartVariable:
         return not self == other
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash(self.id)
 
     def set(self, value):
         return CHART_VARIABLE_SET.format(id=self.id,
@@ -407,7 +598,14 @@ class ChartVariable:
             return None
 
 
-class ChartFlags:
+class ChartFlags(object):
+    __slots__ = (
+        'push',
+        'created',
+        'updated',
+        'obsoleted',
+    )
+
     def __init__(self):
         self.push = True
         self.created = False
@@ -4,8 +4,14 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
+import sys
 
-from threading import Lock
+from threading import Thread
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
 
 PATH = os.getenv('PATH', '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin').split(':')
 
@@ -14,7 +20,7 @@ CHART_CREATE = "CHART {0} '{1}' '{2}' '{3}' '{4}' '{5}' {6} {7} {8}\n"
 DIMENSION_CREATE = "DIMENSION '{0}' '{1}' {2} {3} {4} '{5}'\n"
 DIMENSION_SET = "SET '{0}' = {1}\n"
 
-print_lock = Lock()
+EMITTER_MAX_PENDING = 1000
 
 
 def setdefault_values(config, base_dict):
@@ -60,15 +66,141 @@ def static_vars(**kwargs):
     return decorate
 
 
+class StdoutEmitter(object):
+    """
+    Writes to stdout from a single thread.
+
+    Everything queued while the writer is busy is written with one write() and flush() call.
+    The queue is bounded, if stdout is not drained fast enough emit() blocks the caller.
+    """
+
+    def __init__(self, stream=None, max_pending=EMITTER_MAX_PENDING):
+        self.stream = stream
+        self.queue = Queue(maxsize=max_pending)
+        self.writer = None
+        self.failed = False
+
+    def emit(self, data):
+        if self.failed:
+            raise IOError('stdout write failed')
+        if self.writer is None:
+            self.start()
+        self.queue.put(data)
+
+    def start(self):
+        writer = Thread(target=self.write_loop)
+        writer.daemon = True
+        writer.start()
+        self.writer = writer
+
+    def join(self):
+        if self.writer is not None:
+            self.queue.join()
+
+    def write_loop(self):
+        while True:
+            chunks = [self.queue.get()]
+            while True:
+                try:
+                    chunks.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                if not self.failed:
+                    stream = self.stream or sys.stdout
+                    stream.write(''.join(chunks))
+                    stream.flush()
+            except Exception:
+                # keep draining the queue, emitters must not block forever
+                self.failed = True
+            finally:
+                for _ in chunks:
+                    self.queue.task_done()
+
+
+stdout_emitter = StdoutEmitter()
+
+
+class OutputBuffer(object):
+    """
+    Accumulates output of a job, flushed once per update cycle.
+    """
+
+    def __init__(self):
+        self.chunks = list()
+
+    def write(self, *msg):
+        # every write is a line, same as safe_print()
+        self.chunks.extend(msg)
+        self.chunks.append('\n')
+
+    def flush(self):
+        if not self.chunks:
+            return None
+        data, self.chunks = ''.join(self.chunks), list()
+        safe_write(data)
+        return data
+
+
+class CpuBudget(object):
+    """
+    CPU usage of the plugin process against the `cpu_budget` from python.d.conf (percent of one CPU, 0 is no
+    budget). Measured by the plugin once per second, jobs with adaptive update_every back off when it is exceeded.
+    """
+
+    def __init__(self):
+        self.budget = 0
+        self.usage = 0
+        self.last = None
+
+    def measure(self, now):
+        """
+        :param now: <float> monotonic time
+        """
+        times = os.times()
+        cpu = times[0] + times[1]
+        if self.last is not None and now > self.last[0]:
+            self.usage = (cpu - self.last[1]) * 100 / (now - self.last[0])
+        self.last = now, cpu
+
+    def pressure(self):
+        """
+        :return: <float> usage to budget ratio, 0 if there is no budget
+        """
+        if not self.budget:
+            return 0
+        return self.usage / self.budget
+
+
+cpu_budget = CpuBudget()
+
+
+class UnbufferedOutput(object):
+    @staticmethod
+    def write(*msg):
+        safe_print(*msg)
+
+
 @on_try_except_finally(on_except=(exit, 1))
 def safe_print(*msg):
     """
     :param msg:
     :return:
     """
-    print_lock.acquire()
-    print(''.join(msg))
-    print_lock.release()
+    stdout_emitter.emit(''.join(msg) + '\n')
+
+
+@on_try_except_finally(on_except=(exit, 1))
+def safe_write(data):
+    """
+    :param data: <str> written as is
+    :return:
+    """
+    stdout_emitter.emit(data)
+
+
+def flush_output():
+    stdout_emitter.join()
 
 
 def find_binary(binary):
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# Description: small helper process executing commands for the plugin
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Forking the plugin process means copying the page tables of a big multi-threaded process for every executed
+command. The fork server is a small python process started once, commands are sent to it over a pipe and it
+forks them from its own small address space. Requests are multiplexed, slow commands don't delay others.
+
+Messages are framed as: request id, length, payload.
+    request payload: json {"argv": [...], "stderr": bool}
+    response payload: exit code (signed int), output (stdout or stderr of the command)
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+
+from subprocess import Popen, PIPE
+
+try:
+    from subprocess import DEVNULL
+except ImportError:
+    DEVNULL = open(os.devnull, 'rb')
+
+HEADER = struct.Struct('!II')
+EXIT_CODE = struct.Struct('!i')
+
+SERVER_SCRIPT = os.path.abspath(__file__)
+
+# python 2 closes the descriptors one by one up to the limit, the server has nothing to leak except the pipes
+# of commands running in parallel
+CLOSE_FDS = sys.version_info[0] > 2
+
+SPAWN_ERROR = -1000
+SERVER_GONE = -1001
+
+
+def read_exactly(fd, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = os.read(fd, min(size - len(buf), 1024 * 1024))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def read_message(fd):
+    header = read_exactly(fd, HEADER.size)
+    if header is None:
+        return None, None
+    req_id, size = HEADER.unpack(header)
+    payload = read_exactly(fd, size) if size else b''
+    if payload is None:
+        return None, None
+    return req_id, payload
+
+
+def write_message(fd, req_id, payload):
+    data = HEADER.pack(req_id, len(payload)) + payload
+    while data:
+        data = data[os.write(fd, data):]
+
+
+class ForkServerError(Exception):
+    pass
+
+
+class ForkServer:
+    """
+    Client side, a single server is shared by all jobs of the plugin. It is started on first use and restarted
+    if it exits.
+    """
+
+    def __init__(self, python=None):
+        self.python = python or sys.executable
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.proc = None
+        self.next_id = 0
+
+    def execute(self, argv, stderr=False, timeout=None):
+        """
+        :param argv: <list> command
+        :param stderr: <bool> return stderr instead of stdout
+        :param timeout: <int> seconds to wait for the command, None waits forever
+        :return: tuple: exit code, output <bytes>
+        """
+        request = json.dumps(dict(argv=list(argv), stderr=bool(stderr))).encode('utf-8')
+        done, result = threading.Event(), list()
+        with self.lock:
+            proc = self.start()
+            self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+            req_id = self.next_id
+            proc.pending[req_id] = done, result
+        try:
+            with self.write_lock:
+                write_message(proc.stdin.fileno(), req_id, request)
+        except OSError as error:
+            self.discard(proc, req_id)
+            raise ForkServerError('fork server: {0}'.format(error))
+
+        if not done.wait(timeout) and not done.is_set():
+            self.discard(proc, req_id)
+            raise ForkServerError('fork server: command timed out ({0} sec)'.format(timeout))
+        code, output = result[0]
+        if code == SPAWN_ERROR:
+            raise OSError(output.decode('utf-8', 'replace'))
+        if code == SERVER_GONE:
+            raise ForkServerError('fork server exited')
+        return code, output
+
+    def discard(self, proc, req_id):
+        with self.lock:
+            proc.pending.pop(req_id, None)
+
+    def start(self):
+        if self.proc is not None and self.proc.poll() is None:
+            return self.proc
+        self.proc = Popen([self.python, SERVER_SCRIPT], stdin=PIPE, stdout=PIPE, close_fds=True)
+        # requests in flight, answered by the reader thread of this process
+        self.proc.pending = dict()
+        reader = threading.Thread(target=self.read_responses, args=(self.proc,), name='forkserver')
+        reader.daemon = True
+        reader.start()
+        return self.proc
+
+    def read_responses(self, proc):
+        fd = proc.stdout.fileno()
+        while True:
+            req_id, payload = read_message(fd)
+            if req_id is None:
+                break
+            with self.lock:
+                waiter = proc.pending.pop(req_id, None)
+            if waiter is not None:
+                code = EXIT_CODE.unpack(payload[:EXIT_CODE.size])[0]
+                waiter[1].append((code, payload[EXIT_CODE.size:]))
+                waiter[0].set()
+        proc.wait()
+        with self.lock:
+            if self.proc is proc:
+                self.proc = None
+            pending, proc.pending = proc.pending, dict()
+        for done, result in pending.values():
+            result.append((SERVER_GONE, b''))
+            done.set()
+
+    def stop(self):
+        with self.lock:
+            proc = self.proc
+        if proc is not None:
+            proc.stdin.close()
+
+
+FORK_SERVER = ForkServer()
+
+
+def serve(fd_in, fd_out):
+    write_lock = threading.Lock()
+
+    def respond(req_id, code, output):
+        with write_lock:
+            write_message(fd_out, req_id, EXIT_CODE.pack(code) + output)
+
+    def execute(req_id, payload):
+        try:
+            request = json.loads(payload.decode('utf-8'))
+            # stdin is the requests pipe, commands must not read it
+            p = Popen(request['argv'], stdin=DEVNULL, stdout=PIPE, stderr=PIPE, close_fds=CLOSE_FDS)
+        except Exception as error:
+            respond(req_id, SPAWN_ERROR, str(error).encode('utf-8', 'replace'))
+            return
+        stdout, stderr = p.communicate()
+        respond(req_id, p.returncode, stderr if request.get('stderr') else stdout)
+
+    while True:
+        req_id, payload = read_message(fd_in)
+        if req_id is None:
+            return
+        t = threading.Thread(target=execute, args=(req_id, payload))
+        t.daemon = True
+        t.start()
+
+
+if __name__ == '__main__':
+    # the plugin closes the pipe on exit, running commands are left to finish on their own
+    serve(sys.stdin.fileno(), sys.stdout.fileno())
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Description: extraction of declared paths from JSON documents
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import json
+import re
+import sys
+
+# ijson is optional, it is used only with its C (yajl2) backend, the python backends are slower than json
+try:
+    import ijson.backends.yajl2_c as ijson
+    from ijson.common import JSONError
+except ImportError:
+    ijson = None
+
+# python 3.0-3.5 json.loads accepts only str
+JSON_FROM_BYTES = sys.version_info[0] == 2 or sys.version_info[:2] >= (3, 6)
+
+WILDCARD = '[*]'
+
+RE_PATH = re.compile(r'^(?:[^.\[\]]+|\[\*\])(?:\.[^.\[\]]+|\[\*\])*$')
+RE_TOKEN = re.compile(r'[^.\[\]]+|\[\*\]')
+
+START_EVENTS = ('start_map', 'start_array')
+END_EVENTS = ('end_map', 'end_array')
+
+MISSING = object()
+
+
+def split_path(path):
+    """
+    'queues[*].message_stats.rate' => ['queues', '[*]', 'message_stats', 'rate']
+    """
+    if not RE_PATH.match(path):
+        raise ValueError("invalid json path: '{0}'".format(path))
+    return RE_TOKEN.findall(path)
+
+
+class Node(object):
+    __slots__ = ('keys', 'items', 'full', 'prefix')
+
+    def __init__(self, prefix):
+        self.keys = dict()
+        self.items = None
+        self.full = False
+        self.prefix = prefix
+
+    def child(self, token):
+        if token == WILDCARD:
+            if self.items is None:
+                self.items = Node(self.prefix + ('.item' if self.prefix else 'item'))
+            return self.items
+        node = self.keys.get(token)
+        if node is None:
+            node = self.keys[token] = Node(self.prefix + '.' + token if self.prefix else token)
+        return node
+
+    def walk(self):
+        yield self
+        for node in self.keys.values():
+            for n in node.walk():
+                yield n
+        if self.items is not None:
+            for n in self.items.walk():
+                yield n
+
+
+class JsonPaths(object):
+    """
+    Extracts a set of paths from a JSON document, for example `queues[*].message_stats.publish_details.rate`
+    (`[*]` is every item of an array, a path ending at an object takes the whole object).
+
+    The result has the shape of the document with only the declared paths in it, so code walking the parsed
+    document works unchanged. Missing keys and values of an unexpected type are left out.
+
+    If the ijson C backend is installed the document is parsed as a stream and only the declared paths are
+    kept: when all paths go through one array (`queues[*]...`) its items are built one at a time and pruned,
+    otherwise the result is built from the parse events. Without ijson the document is parsed with json and
+    pruned.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.root = Node('')
+        for path in self.paths:
+            node = self.root
+            for token in split_path(path):
+                node = node.child(token)
+            node.full = True
+        self.nodes = dict((node.prefix, node) for node in self.root.walk())
+        self.records = self.find_records()
+
+    def find_records(self):
+        """
+        :return: tuple: keys leading to the array all paths go through, the array node. None if there is no such
+        """
+        node, keys = self.root, list()
+        while not node.full and node.items is None and len(node.keys) == 1:
+            key, node = next(iter(node.keys.items()))
+            keys.append(key)
+        if node.full or node.keys or node.items is None:
+            return None
+        return keys, node
+
+    @staticmethod
+    def streaming():
+        return ijson is not None
+
+    def extract(self, data):
+        """
+        :param data: <bytes> or <str> JSON document
+        :return: the document with only the declared paths, None if the document doesn't have them
+        """
+        if ijson is not None:
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            try:
+                result = self.stream(io.BytesIO(data))
+            except JSONError as error:
+                raise ValueError(str(error))
+        else:
+            if not JSON_FROM_BYTES and isinstance(data, bytes):
+                data = data.decode('utf-8')
+            result = self.prune(json.loads(data))
+        return None if result is MISSING else result
+
+    def stream(self, f):
+        if self.records is None:
+            return self.build(ijson.parse(f, use_float=True))
+        keys, node = self.records
+        items = (self.prune(item, node.items) for item in ijson.items(f, node.items.prefix, use_float=True))
+        result = [item for item in items if item is not MISSING]
+        for key in reversed(keys):
+            result = {key: result}
+        return result
+
+    def prune(self, value, node=None):
+        node = node or self.root
+        if node.full:
+            return value
+        if node.items is not None and isinstance(value, list):
+            return [v for v in (self.prune(v, node.items) for v in value) if v is not MISSING]
+        if node.keys and isinstance(value, dict):
+            pruned = dict()
+            for key, child in node.keys.items():
+                if key not in value:
+                    continue
+                v = self.prune(value[key], child)
+                if v is not MISSING:
+                    pruned[key] = v
+            return pruned
+        return MISSING
+
+    def build(self, events):
+        """
+        Builds the result from ijson parse events, skipping everything that is not on a declared path.
+        """
+        nodes = self.nodes
+        root = list()
+        # stack of [container, current key, full]
+        stack = [[root, None, False]]
+        skip = 0
+        for prefix, event, value in events:
+            if skip:
+                if event in START_EVENTS:
+                    skip += 1
+                elif event in END_EVENTS:
+                    skip -= 1
+                continue
+            top = stack[-1]
+            if event == 'map_key':
+                top[1] = value
+                continue
+            if event in END_EVENTS:
+                stack.pop()
+                continue
+
+            full = top[2]
+            if not full:
+                node = nodes.get(prefix)
+                if node is None:
+                    if event in START_EVENTS:
+                        skip = 1
+                    continue
+                full = node.full
+                if not full and not (event == 'start_map' and node.keys or event == 'start_array' and node.items):
+                    # unexpected type or a scalar on the way to a declared path
+                    if event in START_EVENTS:
+                        skip = 1
+                    continue
+
+            if event == 'start_map':
+                value = dict()
+            elif event == 'start_array':
+                value = list()
+            container = top[0]
+            if isinstance(container, dict):
+                container[top[1]] = value
+            else:
+                container.append(value)
+            if event in START_EVENTS:
+                stack.append([value, None, full])
+
+        return root[0] if root else MISSING
@@ -3,6 +3,9 @@
 # Author: Ilya Mashchenko (ilyam8)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import hashlib
+import marshal
+import os
 
 from sys import version_info
 
@@ -16,6 +19,12 @@ try:
 except ImportError:
     from yaml import SafeLoader as YamlSafeLoader
 
+# libyaml based loader, available if system PyYAML is built with libyaml
+try:
+    from yaml import CSafeLoader as YamlCSafeLoader
+except ImportError:
+    YamlCSafeLoader = None
+
 
 try:
     from collections import OrderedDict
@@ -25,6 +34,8 @@ except ImportError:
 
 DEFAULT_MAPPING_TAG = 'tag:yaml.org,2002:map' if PY_VERSION > (3, 1) else u'tag:yaml.org,2002:map'
 
+CONFIG_CACHE_VERSION = 1
+
 
 def dict_constructor(loader, node):
     return OrderedDict(loader.construct_pairs(node))
@@ -32,15 +43,110 @@ def dict_constructor(loader, node):
 
 YamlSafeLoader.add_constructor(DEFAULT_MAPPING_TAG, dict_constructor)
 
+if YamlCSafeLoader is not None:
+    # subclass to not change the system PyYAML loader for other users
+    class YamlOrderedCSafeLoader(YamlCSafeLoader):
+        pass
+
+
+    YamlOrderedCSafeLoader.add_constructor(DEFAULT_MAPPING_TAG, dict_constructor)
+    YamlLoader = YamlOrderedCSafeLoader
+else:
+    YamlLoader = YamlSafeLoader
+
 
 def load_yaml(stream):
-    loader = YamlSafeLoader(stream)
+    loader = YamlLoader(stream)
     try:
         return loader.get_single_data()
     finally:
         loader.dispose()
 
 
-def load_config(file_name):
+def load_config(file_name, cache=None):
+    if cache is None:
+        with open(file_name, 'r') as stream:
+            return load_yaml(stream)
+
+    st = os.stat(file_name)
+    found, config = cache.get(file_name, st)
+    if found:
+        return config
     with open(file_name, 'r') as stream:
-        return load_yaml(stream)
+        config = load_yaml(stream)
+    cache.set(file_name, st, config)
+    return config
+
+
+MAP, LIST = 0, 1
+
+
+def encode(value):
+    """
+    Converts parsed config to marshal serializable types, raises TypeError on unsupported ones.
+    Containers are encoded as (tag, items) tuples, YAML never produces tuples itself.
+    """
+    if isinstance(value, dict):
+        return MAP, tuple((encode(k), encode(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return LIST, tuple(encode(v) for v in value)
+    if value is None or isinstance(value, (bool, int, float, str, type(u''))):
+        return value
+    if PY_VERSION < (3, 0) and isinstance(value, long):
+        return value
+    raise TypeError('unsupported type: {0}'.format(type(value)))
+
+
+def decode(value):
+    if not isinstance(value, tuple):
+        return value
+    tag, items = value
+    if tag == MAP:
+        return OrderedDict((decode(k), decode(v)) for k, v in items)
+    return [decode(v) for v in items]
+
+
+class ConfigCache:
+    """
+    Keeps parsed configs on disk, an entry is valid while the config path, mtime and size are unchanged.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def entry_path(self, file_name):
+        key = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.cache')
+
+    @staticmethod
+    def header(file_name, st):
+        return CONFIG_CACHE_VERSION, PY_VERSION, os.path.abspath(file_name), st.st_mtime, st.st_size
+
+    def get(self, file_name, st):
+        try:
+            with open(self.entry_path(file_name), 'rb') as f:
+                header, payload = marshal.load(f)
+            if header != self.header(file_name, st):
+                return False, None
+            return True, decode(payload)
+        except Exception:
+            return False, None
+
+    def set(self, file_name, st, config):
+        try:
+            payload = encode(config)
+        except TypeError:
+            return
+        path = self.entry_path(file_name)
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(tmp, 'wb') as f:
+                marshal.dump((self.header(file_name, st), payload), f)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
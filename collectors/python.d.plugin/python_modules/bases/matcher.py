@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Description: multi-pattern log lines matcher
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import re
+
+from collections import Counter
+from itertools import islice
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from third_party.ordereddict import OrderedDict
+
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+class LinePattern(object):
+    __slots__ = ('name', 'regex', 'prefilter', 'key', 'keys', 'ordered')
+
+    def __init__(self, name, pattern, prefilter=None, key=None, ordered=False):
+        self.name = name
+        self.regex = re.compile(pattern, re.MULTILINE)
+        self.prefilter = prefilter
+        self.key = key
+        self.keys = dict()
+        self.ordered = ordered
+
+    def format_key(self, group):
+        if isinstance(group, tuple):
+            return self.key.format(*group)
+        return self.key.format(group)
+
+    def findall(self, lines):
+        if self.prefilter:
+            lines = [line for line in lines if self.prefilter in line]
+            if not lines:
+                return list()
+        return self.regex.findall(''.join(lines))
+
+
+class LineMatcher(object):
+    """
+    Matches log lines against a set of named patterns, a chunk of lines at a time.
+
+    Every pattern is applied with a single `findall` over the joined chunk, lines without the pattern
+    `prefilter` literal are dropped before that. The result of a match is the pattern group (a tuple if
+    there are several groups), no match objects or dicts are created per line.
+
+    Counting patterns are aggregated into a Counter keyed by (pattern name, group), ordered patterns keep
+    the list of groups in log order for modules which need to replay events (ban/unban).
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.patterns = OrderedDict()
+
+    def add(self, name, pattern, prefilter=None, key=None, ordered=False):
+        """
+        :param name: <str> pattern name
+        :param pattern: <str> regular expression, the groups are the aggregation key
+        :param prefilter: <str> literal every matching line contains
+        :param key: <str> format of the dimension key, formatted with the pattern groups
+        :param ordered: <bool> collect the groups in log order instead of counting them
+        """
+        self.patterns[name] = LinePattern(name, pattern, prefilter, key, ordered)
+
+    def precompute(self, name, groups):
+        """
+        Formats the dimension keys of the pattern for the known groups once.
+        """
+        pattern = self.patterns[name]
+        for group in groups:
+            pattern.keys[group] = pattern.format_key(group)
+
+    def key(self, name, group):
+        pattern = self.patterns[name]
+        try:
+            return pattern.keys[group]
+        except KeyError:
+            return pattern.format_key(group)
+
+    def chunks(self, lines):
+        if isinstance(lines, list):
+            for idx in range(0, len(lines), self.chunk_size):
+                yield lines[idx:idx + self.chunk_size]
+            return
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def feed(self, lines):
+        """
+        :param lines: iterable of lines
+        :return: tuple: Counter {(name, group): count} of counting patterns, dict {name: [group, ...]}
+                 of ordered patterns
+        """
+        counters = Counter()
+        matches = dict((p.name, list()) for p in self.patterns.values() if p.ordered)
+        for chunk in self.chunks(lines):
+            for pattern in self.patterns.values():
+                found = pattern.findall(chunk)
+                if not found:
+                    continue
+                if pattern.ordered:
+                    matches[pattern.name].extend(found)
+                    continue
+                for group, count in Counter(found).items():
+                    counters[pattern.name, group] += count
+        return counters, matches
+
+    def update(self, data, counters):
+        """
+        Adds counters to the data dict, keys that are not in the data are skipped.
+        """
+        for (name, group), count in counters.items():
+            key = self.key(name, group)
+            if key in data:
+                data[key] += count
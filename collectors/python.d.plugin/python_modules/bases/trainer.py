@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Description: background model training for python.d modules
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import hashlib
+import os
+import pickle
+import threading
+
+from sys import version_info
+from time import time
+
+from third_party.monotonic import monotonic
+
+MODEL_STORE_VERSION = 1
+MODEL_STORE_DIR_NAME = 'pythond-models'
+
+# trainings running at once, per module
+TRAINING_SLOTS = dict()
+TRAINING_SLOTS_LOCK = threading.Lock()
+
+
+def training_slots(name, limit):
+    with TRAINING_SLOTS_LOCK:
+        if name not in TRAINING_SLOTS:
+            TRAINING_SLOTS[name] = threading.BoundedSemaphore(max(1, int(limit)))
+        return TRAINING_SLOTS[name]
+
+
+class TrainingResult(object):
+    __slots__ = ('value', 'error', 'elapsed')
+
+    def __init__(self, value, error, elapsed):
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+
+class BackgroundTrainer(object):
+    """
+    Trains the models of a job in a background thread. The job keeps using its current models and swaps in the
+    new ones returned by the training function when `poll()` returns them, so a long training doesn't stop
+    the job updates. Trainings of all jobs of a module share a concurrency limit (the first job sets it).
+    """
+
+    def __init__(self, name, concurrency=1):
+        """
+        :param name: <str> module name
+        :param concurrency: <int> trainings of the module running at once
+        """
+        self.name = name
+        self.slots = training_slots(name, concurrency)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.result = None
+        self.last_elapsed = 0
+
+    def busy(self):
+        return self.thread is not None
+
+    def start(self, func, *args, **kwargs):
+        """
+        :param func: training function, its return value is handed to `poll()`
+        :return: <bool> False if a training is already running
+        """
+        if self.thread is not None:
+            return False
+        self.thread = threading.Thread(target=self.run, args=(func, args, kwargs),
+                                       name='{0}-training'.format(self.name))
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def run(self, func, args, kwargs):
+        with self.slots:
+            start = monotonic()
+            try:
+                value, error = func(*args, **kwargs), None
+            except Exception as err:
+                value, error = None, err
+            result = TrainingResult(value, error, monotonic() - start)
+        with self.lock:
+            self.result = result
+
+    def wait(self, timeout=None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def poll(self):
+        """
+        :return: <TrainingResult> of a finished training, None if there is none
+        """
+        with self.lock:
+            result, self.result = self.result, None
+        if result is not None:
+            self.thread = None
+            self.last_elapsed = result.elapsed
+        return result
+
+
+class ModelStore(object):
+    """
+    Keeps the trained state of a job in NETDATA_LIB_DIR, so a restarted plugin reuses it instead of training again.
+    An entry is used only if it has the same format version, python and libraries versions and job configuration,
+    and it is not older than the given age.
+    """
+
+    def __init__(self, name, directory=None):
+        """
+        :param name: <str> job name
+        :param directory: <str> defaults to NETDATA_LIB_DIR/pythond-models, the store is disabled if it is not set
+        """
+        if directory is None and os.getenv('NETDATA_LIB_DIR'):
+            directory = os.path.join(os.getenv('NETDATA_LIB_DIR'), MODEL_STORE_DIR_NAME)
+        self.directory = directory
+        self.path = os.path.join(directory, name + '.pickle') if directory else None
+
+    @staticmethod
+    def key(configuration, versions=None):
+        """
+        :param configuration: <dict> job configuration, any change invalidates the stored state
+        :param versions: <tuple> versions of the libraries the state is made with
+        :return: <str>
+        """
+        key = repr((sorted((k, repr(v)) for k, v in configuration.items()), versions))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def header(self, key):
+        return MODEL_STORE_VERSION, version_info[:2], key
+
+    def load(self, key, max_age=None):
+        """
+        :param key: <str> ModelStore.key()
+        :param max_age: <int> seconds, None is no limit
+        :return: tuple: stored state or None, its age in seconds
+        """
+        if not self.path:
+            return None, None
+        try:
+            with open(self.path, 'rb') as f:
+                header, saved_at, state = pickle.load(f)
+        except Exception:
+            return None, None
+        age = time() - saved_at
+        if header != self.header(key) or max_age is not None and not 0 <= age <= max_age:
+            return None, age
+        return state, age
+
+    def save(self, key, state):
+        """
+        :return: <bool>
+        """
+        if not self.path:
+            return False
+        tmp = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(tmp, 'wb') as f:
+                os.chmod(tmp, 0o600)
+                pickle.dump((self.header(key), time(), state), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.path)
+        except (IOError, OSError, pickle.PicklingError, TypeError, AttributeError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        return True
@@ -3,9 +3,8 @@
 # Author: ilyam8
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from json import loads
-
 from bases.FrameworkServices.UrlService import UrlService
+from bases.jsonpath import JsonPaths
 
 API_NODE = 'api/nodes'
 API_OVERVIEW = 'api/overview'
@@ -69,6 +68,16 @@ VHOST_MESSAGE_STATS = [
     'message_stats.return_unroutable',
 ]
 
+OVERVIEW_PATHS = JsonPaths(['node'] + OVERVIEW_STATS)
+
+NODE_PATHS = JsonPaths(NODE_STATS)
+
+VHOST_PATHS = JsonPaths(['[*].name', '[*].message_stats'])
+
+QUEUE_COLUMNS = ['vhost', 'name'] + QUEUE_STATS
+
+QUEUE_PATHS = JsonPaths('[*].' + c for c in QUEUE_COLUMNS)
+
 ORDER = [
     'queued_messages',
     'connection_churn_rates',
@@ -318,11 +327,10 @@ class Service(UrlService):
     def get_overview_stats(self):
         url = '{0}/{1}'.format(self.url, API_OVERVIEW)
         self.debug("doing http request to '{0}'".format(url))
-        raw = self._get_raw_data(url)
-        if not raw:
+        data = self._get_json(url, paths=OVERVIEW_PATHS)
+        if not data:
             return None
 
-        data = loads(raw)
         self.node_name = data['node']
         self.debug("found node name: '{0}'".format(self.node_name))
 
@@ -337,11 +345,10 @@ class Service(UrlService):
 
         url = '{0}/{1}/{2}'.format(self.url, API_NODE, self.node_name)
         self.debug("doing http request to '{0}'".format(url))
-        raw = self._get_raw_data(url)
-        if not raw:
+        data = self._get_json(url, paths=NODE_PATHS)
+        if not data:
             return None
 
-        data = loads(raw)
         stats = fetch_data(raw_data=data, metrics=NODE_STATS)
         handle_disabled_disk_monitoring(stats)
         self.debug("number of metrics: {0}".format(len(stats)))
@@ -350,12 +357,11 @@ class Service(UrlService):
     def get_vhosts_stats(self):
         url = '{0}/{1}'.format(self.url, API_VHOSTS)
         self.debug("doing http request to '{0}'".format(url))
-        raw = self._get_raw_data(url)
-        if not raw:
+        vhosts = self._get_json(url, paths=VHOST_PATHS)
+        if not vhosts:
             return None
 
         data = dict()
-        vhosts = loads(raw)
         charts_initialized = len(self.charts) > 0
 
         for vhost in vhosts:
@@ -373,14 +379,14 @@ class Service(UrlService):
         return data
 
     def get_queues_stats(self):
-        url = '{0}/{1}'.format(self.url, API_QUEUES)
+        # only the needed columns, servers ignoring the parameter send everything and the paths filter it
+        url = '{0}/{1}?columns={2}'.format(self.url, API_QUEUES, ','.join(QUEUE_COLUMNS))
         self.debug("doing http request to '{0}'".format(url))
-        raw = self._get_raw_data(url)
-        if not raw:
+        queues = self._get_json(url, paths=QUEUE_PATHS)
+        if not queues:
             return None
 
         data = dict()
-        queues = loads(raw)
         charts_initialized = len(self.charts) > 0
 
         for queue in queues:
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import importlib.util
+import itertools
+import os
+import sys
+import unittest
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, os.path.join(PLUGIN_DIR, 'python_modules'))
+
+
+def load_anomalies():
+    try:
+        spec = importlib.util.spec_from_file_location(
+            'anomalies', os.path.join(PLUGIN_DIR, 'anomalies', 'anomalies.chart.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except ImportError:
+        return None
+    return module
+
+
+anomalies = load_anomalies()
+
+
+def make_features(arr, params, scaler=None):
+    spec = {'params': {'m': params}, 'normalize': ['m'] if scaler else [], 'train_max_n': len(arr)}
+    # the reference implementation doesn't use the job state when it is given the parameters
+    return anomalies.Service.make_features(None, arr, model='m', scaler=scaler, spec=spec)
+
+
+@unittest.skipIf(anomalies is None, 'anomalies dependencies (numpy, pandas, pyod, sklearn, netdata_pandas) are not installed')
+class TestFeatureBuffer(unittest.TestCase):
+    def assert_same_as_make_features(self, arr, params, scaler=None):
+        buffer = anomalies.FeatureBuffer(anomalies.pd.Index(['a', 'b', 'c']), *params, scaler=scaler)
+        for t in range(len(arr)):
+            features = buffer.push(arr[t])
+            expected = make_features(arr[:t + 1], params, scaler)
+            if features is None:
+                self.assertEqual(len(expected), 0, 'params {0}, sample {1}'.format(params, t))
+            else:
+                anomalies.np.testing.assert_allclose(
+                    features, expected[-1], rtol=1e-9, atol=1e-9, err_msg='params {0}, sample {1}'.format(params, t))
+
+    def test_features_are_the_last_row_of_make_features(self):
+        arr = anomalies.np.random.default_rng(1).normal(size=(40, 3)) * 10
+        for params in itertools.product((0, 1, 2), (0, 1, 3), (0, 1, 4)):
+            self.assert_same_as_make_features(arr, params)
+
+    def test_features_of_a_normalized_model(self):
+        rng = anomalies.np.random.default_rng(2)
+        scaler = anomalies.MinMaxScaler().fit(rng.normal(size=(100, 3)))
+        self.assert_same_as_make_features(rng.normal(size=(30, 3)), (1, 3, 2), scaler)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python_modules'))
+
+from bases.charts import Charts  # noqa: E402
+
+
+class RecordingOutput(object):
+    def __init__(self):
+        self.lines = list()
+
+    def write(self, *msg):
+        self.lines.append(''.join(msg))
+
+    def pop(self):
+        lines, self.lines = self.lines, list()
+        return lines
+
+
+def new_charts(output, skip_unchanged=False):
+    charts = Charts(job_name=lambda: 'example', priority=60000, cleanup=10, get_update_every=lambda: 1,
+                    module_name='example', output=output, skip_unchanged=skip_unchanged)
+    chart = charts.add_chart(['chart', None, 'Title', 'units', 'family', 'example.chart', 'line'])
+    chart.add_dimension(['a'])
+    chart.add_dimension(['b', 'B', 'incremental'])
+    return charts, chart
+
+
+def updates_sent(chart, output, data, n):
+    sent = list()
+    for _ in range(n):
+        chart.update(data, 1000000)
+        sent.append(any(line.startswith('BEGIN') for line in output.pop()))
+    return sent
+
+
+class TestChart(unittest.TestCase):
+    def test_params_are_read_only(self):
+        _, chart = new_charts(RecordingOutput())
+        with self.assertRaises(TypeError):
+            chart.params['title'] = 'New title'
+        with self.assertRaises(TypeError):
+            chart.params.update(title='New title')
+        with self.assertRaises(TypeError):
+            chart.dimensions[0].params['hidden'] = 'hidden'
+        chart.title = 'New title'
+        self.assertEqual(chart.params['title'], 'New title')
+
+    def test_dimensions_are_read_only(self):
+        _, chart = new_charts(RecordingOutput())
+        with self.assertRaises(AttributeError):
+            chart.dimensions.append('c')
+        self.assertEqual([dim.id for dim in chart.dimensions], ['a', 'b'])
+        self.assertIn('a', chart.dimensions)
+
+    def test_del_dimension_redefines_the_chart(self):
+        output = RecordingOutput()
+        _, chart = new_charts(output)
+        chart.add_variable(['var', 5])
+        chart.update({'a': 1, 'b': 2}, 0)
+        output.pop()
+
+        chart.del_dimension('a')
+        self.assertEqual(output.pop(), [
+            "CHART example.chart '' 'Title' 'units' 'family' 'example.chart' line 60000 1 '' "
+            "'python.d.plugin' 'example'\n"
+            "DIMENSION 'a' 'a' absolute 1 1 'hidden obsolete'\n"
+            "DIMENSION 'b' 'B' incremental 1 1 ' '\n"
+            "VARIABLE CHART 'var' = 5\n",
+        ])
+        self.assertNotIn('a', chart)
+
+        chart.update({'a': 1, 'b': 2}, 1000000)
+        self.assertEqual(output.pop(), ["BEGIN example.chart 1000000\nSET 'b' = 2\nEND\n"])
+
+
+class TestSkipUnchanged(unittest.TestCase):
+    def test_disabled_sends_every_update(self):
+        output = RecordingOutput()
+        _, chart = new_charts(output)
+        self.assertEqual(updates_sent(chart, output, {'a': 1, 'b': 2}, 5), [True] * 5)
+
+    def test_unchanged_chart_is_sent_every_other_update(self):
+        output = RecordingOutput()
+        _, chart = new_charts(output, skip_unchanged=True)
+        self.assertEqual(updates_sent(chart, output, {'a': 1, 'b': 2}, 5), [True, False, True, False, True])
+
+    def test_max_skipped_updates_in_a_row(self):
+        output = RecordingOutput()
+        _, chart = new_charts(output, skip_unchanged=3)
+        self.assertEqual(updates_sent(chart, output, {'a': 1, 'b': 2}, 6), [True, False, False, False, True, False])
+
+    def test_changed_values_are_sent(self):
+        output = RecordingOutput()
+        _, chart = new_charts(output, skip_unchanged=3)
+        self.assertEqual(updates_sent(chart, output, {'a': 1, 'b': 2}, 2), [True, False])
+        self.assertEqual(updates_sent(chart, output, {'a': 2, 'b': 2}, 2), [True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import unittest
+
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python_modules'))
+
+from bases import collection  # noqa: E402
+from bases.collection import OutputBuffer, StdoutEmitter, UnbufferedOutput  # noqa: E402
+
+
+class StdoutCapture(object):
+    def __enter__(self):
+        self.stream = StringIO()
+        self.saved, collection.stdout_emitter = collection.stdout_emitter, StdoutEmitter(stream=self.stream)
+        return self
+
+    def __exit__(self, *args):
+        collection.stdout_emitter.join()
+        collection.stdout_emitter = self.saved
+
+    def value(self):
+        collection.stdout_emitter.join()
+        return self.stream.getvalue()
+
+
+def write_cycle(output):
+    output.write(u'BEGIN example.chart 1000000\n', u"SET 'a' = 1\n", u"SET 'b' = 2\n", u'END\n')
+    output.write(u'BEGIN netdata.runtime_example 1000000\nSET run_time = 3\nEND\n')
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_flush_writes_the_same_bytes_as_unbuffered_output(self):
+        with StdoutCapture() as unbuffered:
+            write_cycle(UnbufferedOutput())
+            expected = unbuffered.value()
+
+        with StdoutCapture() as buffered:
+            output = OutputBuffer()
+            write_cycle(output)
+            output.flush()
+            self.assertEqual(buffered.value(), expected)
+
+        self.assertEqual(
+            expected,
+            u"BEGIN example.chart 1000000\nSET 'a' = 1\nSET 'b' = 2\nEND\n\n"
+            u'BEGIN netdata.runtime_example 1000000\nSET run_time = 3\nEND\n\n',
+        )
+
+    def test_flush_without_writes(self):
+        with StdoutCapture() as capture:
+            output = OutputBuffer()
+            self.assertIsNone(output.flush())
+            output.write(u'END\n')
+            self.assertEqual(output.flush(), u'END\n\n')
+            self.assertIsNone(output.flush())
+            self.assertEqual(capture.value(), u'END\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
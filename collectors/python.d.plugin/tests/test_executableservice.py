@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python_modules'))
+
+from bases.FrameworkServices.ExecutableService import ExecCache  # noqa: E402
+
+KEY = (('arcconf', 'getconfig'), False, False)
+
+
+class HangingCommand(object):
+    def __init__(self, cache):
+        self.cache = cache
+        self.release = threading.Event()
+        self.thread = threading.Thread(target=self.cache.get, args=(KEY, 10, self.execute))
+        self.thread.daemon = True
+
+    def execute(self):
+        self.release.wait()
+        return ['hung']
+
+    def __enter__(self):
+        self.thread.start()
+        while self.cache.results[KEY].finished is not None:
+            time.sleep(0.001)
+        return self.cache.results[KEY]
+
+    def __exit__(self, *args):
+        self.release.set()
+        self.thread.join()
+
+
+class TestExecCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ExecCache()
+        self.cache.get(KEY, 10, lambda: ['previous'])
+
+    def age(self, seconds):
+        self.cache.results[KEY].finished -= seconds
+
+    def test_recent_previous_output_is_returned_while_the_command_runs(self):
+        self.age(10)
+        with HangingCommand(self.cache):
+            self.assertEqual(self.cache.get(KEY, 10, lambda: ['executed'], 0.01, 30), (['previous'], True))
+
+    def test_old_previous_output_is_not_returned(self):
+        self.age(60)
+        with HangingCommand(self.cache):
+            self.assertEqual(self.cache.get(KEY, 10, lambda: ['executed'], 0.01, 30), (None, True))
+
+    def test_command_running_longer_than_the_timeout_is_executed_again(self):
+        self.age(10)
+        with HangingCommand(self.cache) as running:
+            running.started -= 5
+            self.assertEqual(self.cache.get(KEY, 10, lambda: ['executed'], 1, 30), (['executed'], False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import time
+import unittest
+
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python_modules'))
+
+from bases import collection  # noqa: E402
+from bases.collection import StdoutEmitter  # noqa: E402
+from bases.FrameworkServices.SimpleService import SimpleService  # noqa: E402
+
+
+class SlowService(SimpleService):
+    def __init__(self, configuration=None, name=None):
+        SimpleService.__init__(self, configuration=configuration, name=name)
+        self.order = ['chart']
+        self.definitions = {'chart': {'options': [None, 'Title', 'units', 'family', 'example.chart', 'line'],
+                                      'lines': [['a']]}}
+
+    def get_data(self):
+        time.sleep(0.01)
+        return {'a': 1}
+
+
+def new_service(**configuration):
+    configuration = dict(dict(job_name='slow', override_name=None, update_every=1, priority=60000, penalty=True,
+                              chart_cleanup=10, autodetection_retry=0), **configuration)
+    return SlowService(configuration=configuration, name='slow')
+
+
+class TestAdaptiveUpdateEvery(unittest.TestCase):
+    def setUp(self):
+        self.stream = StringIO()
+        self.saved, collection.stdout_emitter = collection.stdout_emitter, StdoutEmitter(stream=self.stream)
+
+    def tearDown(self):
+        collection.stdout_emitter.join()
+        collection.stdout_emitter = self.saved
+
+    def output(self):
+        collection.stdout_emitter.join()
+        data, _ = self.stream.getvalue(), self.stream.truncate(0)
+        self.stream.seek(0)
+        return data
+
+    def test_runtime_charts_are_redefined_with_the_stretched_interval(self):
+        service = new_service(adaptive_update_every=True, adaptive_threshold=0.001)
+        runtime = "CHART netdata.runtime_{0} '' 'Execution time' 'ms' 'python.d' netdata.pythond_runtime " \
+                  "line 145000 {1} ".format
+        interval = "CHART netdata.runtime_{0}_interval '' 'Effective update interval' 'seconds' 'python.d' " \
+                   "netdata.pythond_runtime_interval line 145000 {1} ".format
+        service.create()
+        self.assertIn(runtime(service.name, 1), self.output())
+
+        service.run_once()
+
+        output = self.output()
+        self.assertIn(runtime(service.name, 2), output)
+        self.assertIn(interval(service.name, 2), output)
+
+        # the job charts are redefined with their next update
+        service.run_once()
+        self.assertIn("CHART {0}.chart '' 'Title' 'units' 'family' 'example.chart' line 60000 ".format(service.name),
+                      self.output())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python_modules'))
+
+from bases.FrameworkServices.SocketService import SocketService  # noqa: E402
+
+
+def new_service():
+    configuration = dict(job_name='test', override_name=None, update_every=1, priority=1, penalty=True,
+                         chart_cleanup=10, autodetection_retry=0)
+    return SocketService(configuration=configuration, name='test')
+
+
+class TestSend(unittest.TestCase):
+    def setUp(self):
+        self.service = new_service()
+        self.service._sock, self.peer = socket.socketpair()
+        self.peer.settimeout(1)
+
+    def tearDown(self):
+        self.service._sock.close()
+        self.peer.close()
+
+    def test_request_argument_is_sent_without_a_default_request(self):
+        self.service.request = ''.encode()
+
+        self.assertTrue(self.service._send(b'stats\r\n'))
+        self.assertEqual(self.peer.recv(100), b'stats\r\n')
+
+    def test_nothing_is_sent_without_a_request(self):
+        self.service.request = ''.encode()
+        self.peer.setblocking(False)
+
+        self.assertTrue(self.service._send())
+        self.assertRaises(socket.error, self.peer.recv, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
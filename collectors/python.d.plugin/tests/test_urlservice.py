@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import ssl
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python_modules'))
+
+import urllib3  # noqa: E402
+
+from bases.FrameworkServices import UrlService  # noqa: E402
+from bases.FrameworkServices.UrlService import PoolRegistry, TLS_SESSION_RESUMPTION  # noqa: E402
+
+
+def system_ca_count():
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_default_certs()
+    return context.cert_store_stats()['x509_ca']
+
+
+def manager_ca_count(params):
+    manager = PoolRegistry().get(urllib3.PoolManager, params)
+    return manager.connection_pool_kw['ssl_context'].cert_store_stats()['x509_ca']
+
+
+@unittest.skipUnless(TLS_SESSION_RESUMPTION, 'no TLS session resumption')
+class TestSharedPoolTLS(unittest.TestCase):
+    @unittest.skipUnless(TLS_SESSION_RESUMPTION and system_ca_count(), 'no system CA certificates')
+    def test_system_ca_certificates_are_loaded(self):
+        self.assertEqual(manager_ca_count(dict()), system_ca_count())
+
+    def test_system_ca_certificates_are_not_loaded_with_a_ca_file(self):
+        self.assertEqual(manager_ca_count(dict(ca_certs='/path/to/ca.pem')), 0)
+
+    def test_system_ca_certificates_are_not_loaded_without_verification(self):
+        self.assertEqual(manager_ca_count(dict(ca_certs=None, cert_reqs='CERT_NONE', assert_hostname=False)), 0)
+
+
+class TestPoolRegistry(unittest.TestCase):
+    def test_shared_manager(self):
+        registry = PoolRegistry()
+        params = dict(headers={'User-Agent': 'netdata'})
+        self.assertIs(registry.get(urllib3.PoolManager, params), registry.get(urllib3.PoolManager, dict(params)))
+        self.assertIsNot(registry.get(urllib3.PoolManager, params),
+                         registry.get(urllib3.PoolManager, dict(headers={'User-Agent': 'other'})))
+
+    def test_jobs_polling_other_hosts_have_their_own_manager(self):
+        registry = PoolRegistry()
+        local = registry.get(urllib3.PoolManager, dict(), ('http', 'localhost', 80))
+
+        self.assertIs(registry.get(urllib3.PoolManager, dict(), ('http', 'localhost', 80)), local)
+        self.assertIsNot(registry.get(urllib3.PoolManager, dict(), ('http', 'remote', 80)), local)
+
+    def test_connections_of_concurrent_jobs_are_kept(self):
+        manager = PoolRegistry().get(urllib3.PoolManager, dict(), ('http', 'localhost', 80))
+        pool = manager.connection_from_host('localhost', 80)
+        connections = [pool._get_conn() for _ in range(3)]
+        for conn in connections:
+            pool._put_conn(conn)
+
+        self.assertEqual(pool.num_connections, 3)
+        self.assertEqual(len([c for c in pool.pool.queue if c is not None]), 3)
+
+    def test_unhashable_header_value(self):
+        registry = PoolRegistry()
+        params = dict(headers={'X-Tags': ['a', 'b']})
+
+        self.assertIs(registry.get(urllib3.PoolManager, params), registry.get(urllib3.PoolManager, dict(params)))
+
+    def test_evicted_manager_is_not_closed(self):
+        registry = PoolRegistry(idle_timeout=10)
+        manager = registry.get(urllib3.PoolManager, dict())
+        pool = manager.connection_from_host('localhost', 80)
+        manager.last_used -= 20
+        registry.last_evict -= UrlService.POOL_EVICT_EVERY
+
+        registry.evict_idle()
+
+        self.assertIs(manager.connection_from_host('localhost', 80), pool)
+        self.assertIsNot(registry.get(urllib3.PoolManager, dict()), manager)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import importlib.util
+import math
+import os
+import sys
+import unittest
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, os.path.join(PLUGIN_DIR, 'python_modules'))
+
+
+def load_zscores():
+    try:
+        spec = importlib.util.spec_from_file_location('zscores', os.path.join(PLUGIN_DIR, 'zscores', 'zscores.chart.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except ImportError:
+        return None
+    return module
+
+
+zscores = load_zscores()
+
+
+@unittest.skipIf(zscores is None, 'zscores dependencies (numpy, pandas, netdata_pandas) are not installed')
+class TestOnlineZScores(unittest.TestCase):
+    def setUp(self):
+        self.engine = zscores.OnlineZScores(smooth_n=1)
+
+    def update(self, **values):
+        z = self.engine.update(zscores.pd.Series(values, dtype=float))
+        return dict(zip(self.engine.metrics, z))
+
+    def test_metric_appearing_mid_run_is_not_scored_before_it_has_a_variance(self):
+        self.engine = zscores.OnlineZScores(smooth_n=1, min_samples=2)
+        for value in (10, 12, 11, 13):
+            self.update(a=value)
+
+        self.assertTrue(math.isnan(self.update(a=12, b=500)['b']))
+        self.assertTrue(math.isnan(self.update(a=12, b=510)['b']))
+        z = self.update(a=12, b=505)
+        self.assertFalse(math.isnan(z['b']))
+        self.assertLessEqual(abs(z['b']), 300)
+
+    def test_metric_is_not_scored_during_the_warm_up(self):
+        values = zscores.np.random.default_rng(1).normal(size=zscores.MIN_SAMPLES + 1)
+        for value in values[:zscores.MIN_SAMPLES]:
+            self.assertTrue(math.isnan(self.update(a=value)['a']))
+
+        self.assertFalse(math.isnan(self.update(a=values[-1])['a']))
+
+    def test_metric_appearing_mid_run_is_not_scored_during_the_warm_up(self):
+        index = zscores.pd.Index(['a'])
+        self.engine.seed(zscores.pd.Series([10.0], index=index), zscores.pd.Series([2.0], index=index), 100)
+
+        self.assertFalse(math.isnan(self.update(a=11, b=500)['a']))
+        self.assertTrue(math.isnan(self.update(a=11, b=510)['b']))
+        self.assertTrue(math.isnan(self.update(a=11, b=505)['b']))
+
+    def test_constant_metric_is_not_scored(self):
+        for _ in range(zscores.MIN_SAMPLES + 5):
+            z = self.update(a=7)
+        self.assertTrue(math.isnan(z['a']))
+
+    def test_seeded_metric_is_scored_against_the_seed(self):
+        index = zscores.pd.Index(['a'])
+        self.engine.seed(zscores.pd.Series([10.0], index=index), zscores.pd.Series([2.0], index=index), 100)
+
+        self.assertAlmostEqual(self.update(a=16)['a'], 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
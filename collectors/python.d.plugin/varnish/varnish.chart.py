@@ -5,7 +5,7 @@
 
 import re
 
-from bases.FrameworkServices.ExecutableService import ExecutableService
+from bases.FrameworkServices.ExecutableService import ExecutableService, find_all
 from bases.collection import find_binary
 
 ORDER = [
@@ -196,16 +196,15 @@ class VarnishVersion:
 
 
 class Parser:
-    _backend_new = re.compile(r'VBE.([\d\w_.]+)\(.*?\).(beresp[\w_]+)\s+(\d+)')
-    _backend_old = re.compile(r'VBE\.[\d\w-]+\.([\w\d_-]+).(beresp[\w_]+)\s+(\d+)')
-    _default = re.compile(r'([A-Z]+\.)?([\d\w_.]+)\s+(\d+)')
+    _backend_new = re.compile(br'VBE.([\d\w_.]+)\(.*?\).(beresp[\w_]+)\s+(\d+)')
+    _backend_old = re.compile(br'VBE\.[\d\w-]+\.([\w\d_-]+).(beresp[\w_]+)\s+(\d+)')
+    _default = re.compile(br'([A-Z]+\.)?([\d\w_.]+)\s+(\d+)')
 
     def __init__(self):
         self.re_default = None
         self.re_backend = None
 
     def init(self, data):
-        data = ''.join(data)
         parsed_main = Parser._default.findall(data)
         if parsed_main:
             self.re_default = Parser._default
@@ -219,10 +218,10 @@ class Parser:
                 self.re_backend = Parser._backend_old
 
     def server_stats(self, data):
-        return self.re_default.findall(''.join(data))
+        return find_all(self.re_default, data)
 
     def backend_stats(self, data):
-        return self.re_backend.findall(''.join(data))
+        return find_all(self.re_backend, data)
 
 
 class Service(ExecutableService):
@@ -273,7 +272,7 @@ class Service(ExecutableService):
             return False
 
         # STDOUT is not empty
-        reply = self._get_raw_data()
+        reply = self._get_raw_data(raw=True)
         if not reply:
             self.error("no output from '{0}'. Is it running? Not enough privileges?".format(' '.join(self.command)))
             return False
@@ -292,7 +291,7 @@ class Service(ExecutableService):
         Format data received from shell command
         :return: dict
         """
-        raw = self._get_raw_data()
+        raw = self._get_raw_data(raw=True)
         if not raw:
             return None
 
@@ -11,6 +11,7 @@ import numpy as np
 import pandas as pd
 
 from bases.FrameworkServices.SimpleService import SimpleService
+from bases.trainer import BackgroundTrainer, ModelStore
 from netdata_pandas.data import get_data, get_allmetrics
 
 priority = 60000
@@ -19,7 +20,8 @@ disabled_by_default = True
 
 ORDER = [
     'z',
-    '3stddev'
+    '3stddev',
+    'training'
 ]
 
 CHARTS = {
@@ -31,8 +33,135 @@ CHARTS = {
         'options': ['3stddev', 'Z Score >3', 'count', '3 Stddev', 'zscores.3stddev', 'stacked'],
         'lines': []
     },
+    'training': {
+        'options': ['training', 'Mean And Stddev Calculation Time', 'seconds', 'training', 'zscores.training', 'line'],
+        'lines': [
+            ['training_time', 'time', 'absolute', 1, 1000]
+        ]
+    },
 }
 
+# format of the saved running mean and stddev
+MODEL_FORMAT = 'online-1'
+
+# metrics which are not seeded are scored once the running mean and stddev stand for that many samples
+MIN_SAMPLES = 30
+
+
+class OnlineZScores:
+    """Smoothed z scores from a running mean and variance per metric.
+
+    The mean and variance are updated from every sample with Welford's algorithm, exponentially decayed by `alpha`
+    once there are more than 1/alpha samples. The z scores of the last `smooth_n` samples are kept in a ring buffer
+    with their running sum, so every sample costs a few vector operations over the metrics.
+    """
+
+    def __init__(self, alpha=0.0, smooth_n=15, z_clip=10, z_abs=True, min_samples=MIN_SAMPLES):
+        """
+        :param alpha <float>: decay of the mean and variance, 0 weighs all samples the same.
+        :param smooth_n <int>: z scores are averaged over that many last samples.
+        :param z_clip <float>: z scores are clipped to +/- that value.
+        :param z_abs <bool>: absolute z scores.
+        :param min_samples <int>: metrics are scored once their mean and variance stand for that many samples,
+        seeded metrics are scored right away.
+        """
+        self.alpha = alpha
+        self.min_samples = max(int(min_samples), 2)
+        self.smooth_n = max(int(smooth_n), 1)
+        self.z_clip = z_clip
+        self.z_abs = z_abs
+        self.metrics = pd.Index([])
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.z = np.full((self.smooth_n, 0), np.nan)
+        self.z_sum = np.zeros(0)
+        self.z_count = np.zeros(0)
+        self.samples = 0
+
+    def add_metrics(self, metrics):
+        """Start tracking the metrics which are not tracked yet.
+
+        :param metrics <pd.Index>: metric names.
+        """
+        new = metrics.difference(self.metrics)
+        if new.empty:
+            return
+        k = len(new)
+        self.metrics = self.metrics.append(new)
+        self.n = np.concatenate((self.n, np.zeros(k)))
+        self.mean = np.concatenate((self.mean, np.zeros(k)))
+        self.var = np.concatenate((self.var, np.zeros(k)))
+        self.z = np.concatenate((self.z, np.full((self.smooth_n, k), np.nan)), axis=1)
+        self.z_sum = np.concatenate((self.z_sum, np.zeros(k)))
+        self.z_count = np.concatenate((self.z_count, np.zeros(k)))
+
+    def seed(self, mean, std, n):
+        """Start from a mean and stddev calculated from the history, they count as `n` samples.
+
+        :param mean <pd.Series>: mean per metric.
+        :param std <pd.Series>: stddev per metric.
+        :param n <int>: number of samples the mean and stddev stand for.
+        """
+        df = pd.concat([mean.rename('mean'), std.rename('std')], axis=1, join='inner').dropna()
+        self.add_metrics(df.index)
+        pos = self.metrics.get_indexer(df.index)
+        self.mean[pos] = df['mean'].to_numpy(dtype=float)
+        self.var[pos] = df['std'].to_numpy(dtype=float) ** 2
+        self.n[pos] = max(n, self.min_samples)
+
+    def state(self):
+        return {'metrics': self.metrics, 'n': self.n, 'mean': self.mean, 'var': self.var}
+
+    def load_state(self, state):
+        self.add_metrics(state['metrics'])
+        pos = self.metrics.get_indexer(state['metrics'])
+        self.n[pos], self.mean[pos], self.var[pos] = state['n'], state['mean'], state['var']
+
+    def update(self, values):
+        """Score the latest sample, then add it to the running mean and variance.
+
+        :param values <pd.Series>: latest value per metric.
+        :return: <np.ndarray> smoothed z score (x100) of every metric in `self.metrics`, NaN if there is none.
+        """
+        self.add_metrics(values.index)
+        x = values.reindex(self.metrics).to_numpy(dtype=float)
+        seen = ~np.isnan(x)
+
+        # z scores of the metrics with a value and enough history for a meaningful variance, against the history
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (x - self.mean) / np.sqrt(self.var)
+        z = np.nan_to_num(np.clip(z, -self.z_clip, self.z_clip)) * 100
+        if self.z_abs:
+            z = np.abs(z)
+        z[~(seen & (self.n >= self.min_samples) & (self.var > 0))] = np.nan
+        smoothed = self.smooth(z)
+
+        self.n[seen] += 1
+        alpha = np.maximum(1 / self.n[seen], self.alpha)
+        delta = x[seen] - self.mean[seen]
+        self.mean[seen] += alpha * delta
+        self.var[seen] = (1 - alpha) * (self.var[seen] + alpha * delta * delta)
+
+        return smoothed
+
+    def smooth(self, z):
+        """Add z scores to the ring buffer.
+
+        :return: <np.ndarray> mean of the last `smooth_n` z scores per metric, NaN values are left out.
+        """
+        slot = self.samples % self.smooth_n
+        self.samples += 1
+        old = self.z[slot]
+        self.z_sum += np.nan_to_num(z) - np.nan_to_num(old)
+        self.z_count += np.isnan(old).astype(int) - np.isnan(z).astype(int)
+        self.z[slot] = z
+        if slot == self.smooth_n - 1:
+            # no rounding errors pile up in the running sum
+            self.z_sum = np.nansum(self.z, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.z_count > 0, self.z_sum / self.z_count, np.nan)
+
 
 class Service(SimpleService):
     def __init__(self, configuration=None, name=None):
@@ -53,14 +182,24 @@ class Service(SimpleService):
         self.z_clip = self.configuration.get('z_clip', 10)
         self.z_abs = bool(self.configuration.get('z_abs', True))
         self.burn_in = self.configuration.get('burn_in', 2)
+        self.min_samples = self.configuration.get('min_samples', MIN_SAMPLES)
         self.mode = self.configuration.get('mode', 'per_chart')
         self.per_chart_agg = self.configuration.get('per_chart_agg', 'mean')
+        self.decay_secs = self.configuration.get('decay_secs', self.train_secs)
         self.order = ORDER
         self.definitions = CHARTS
         self.collected_dims = {'z': set(), '3stddev': set()}
-        self.df_mean = pd.DataFrame()
-        self.df_std = pd.DataFrame()
-        self.df_z_history = pd.DataFrame()
+        alpha = self.update_every / self.decay_secs if self.decay_secs else 0.0
+        self.engine = OnlineZScores(alpha, smooth_n=self.z_smooth_n, z_clip=self.z_clip, z_abs=self.z_abs,
+                                    min_samples=self.min_samples)
+        self.seeded = False
+        self.chart_codes = np.zeros(0, dtype=int)
+        self.chart_names = pd.Index([])
+        self.trainer = BackgroundTrainer(self.module_name, self.configuration.get('training_concurrency', 1))
+        self.persist_models = bool(self.configuration.get('persist_models', True))
+        self.model_store = ModelStore(self.name)
+        self.model_store_key = ModelStore.key(self.configuration, (MODEL_FORMAT, np.__version__, pd.__version__))
+        self.warm_start = None
 
     def check(self):
         _ = get_allmetrics(self.host, self.charts_in_scope, wide=True, col_sep='.')
@@ -80,50 +219,75 @@ class Service(SimpleService):
                 self.charts[chart].del_dimension(dim, hide=False)
 
     def train_model(self):
-        """Calculate the mean and stddev for all relevant metrics and store them for use in calulcating zscore at each timestep.
+        """Calculate the mean and stddev for all relevant metrics to seed the running mean and stddev with.
+        Runs in the background.
+
+        :return: (<pd.DataFrame>,<pd.DataFrame>) tuple of dataframes, one for means and the other for stddevs.
         """
         before = int(datetime.now().timestamp()) - self.offset_secs
         after = before - self.train_secs
 
-        self.df_mean = get_data(
+        df_mean = get_data(
             self.host, self.charts_in_scope, after, before, points=10, group='average', col_sep='.'
         ).mean().to_frame().rename(columns={0: "mean"})
 
-        self.df_std = get_data(
+        df_std = get_data(
             self.host, self.charts_in_scope, after, before, points=10, group='stddev', col_sep='.'
         ).mean().to_frame().rename(columns={0: "std"})
 
+        return df_mean, df_std
+
+    def save_model(self):
+        """Save the running mean and stddev for a restart.
+        """
+        if not self.model_store.save(self.model_store_key, self.engine.state()):
+            self.info(f'failed to save the mean and stddev to {self.model_store.path}')
+
+    def load_model(self):
+        """Load the running mean and stddev saved by the previous run if they are not older than the saving interval.
+
+        :return: <bool> True if they were loaded.
+        """
+        state, age = self.model_store.load(self.model_store_key, self.train_every_n * self.update_every)
+        if state is None:
+            return False
+        self.engine.load_state(state)
+        self.info(f'loaded mean and stddev saved {round(age)} seconds ago from {self.model_store.path}')
+        return True
+
     def create_data(self, df_allmetrics):
-        """Use x, mean, stddev to generate z scores and 3stddev flags via some pandas manipulation.
+        """Update the running mean and stddev with the latest values and generate smoothed z scores and 3stddev flags.
         Returning two dictionaries of dimensions and measures, one for each chart.
 
         :param df_allmetrics <pd.DataFrame>: pandas dataframe with latest data from api/v1/allmetrics.
         :return: (<dict>,<dict>) tuple of dictionaries, one for  zscores and the other for a flag if abs(z)>3.
         """
-        # calculate clipped z score for each available metric
-        df_z = pd.concat([self.df_mean, self.df_std, df_allmetrics], axis=1, join='inner')
-        df_z['z'] = ((df_z['value'] - df_z['mean']) / df_z['std']).clip(-self.z_clip, self.z_clip).fillna(0) * 100
-        if self.z_abs:
-            df_z['z'] = df_z['z'].abs()
-
-        # append last z_smooth_n rows of zscores to history table in wide format
-        self.df_z_history = self.df_z_history.append(
-            df_z[['z']].reset_index().pivot_table(values='z', columns='index'), sort=True
-        ).tail(self.z_smooth_n)
-
-        # get average zscore for last z_smooth_n for each metric
-        df_z_smooth = self.df_z_history.melt(value_name='z').groupby('index')['z'].mean().to_frame()
-        df_z_smooth['3stddev'] = np.where(abs(df_z_smooth['z']) > 300, 1, 0)
-        data_z = df_z_smooth['z'].add_suffix('_z').to_dict()
+        z = self.engine.update(df_allmetrics['value'])
+        present = ~np.isnan(z)
+        z = z[present]
 
         # aggregate to chart level if specified
         if self.mode == 'per_chart':
-            df_z_smooth['chart'] = ['.'.join(x[0:2]) + '_z' for x in df_z_smooth.index.str.split('.').to_list()]
+            if len(self.chart_codes) != len(self.engine.metrics):
+                charts = ['.'.join(x[0:2]) + '_z' for x in self.engine.metrics.str.split('.').to_list()]
+                self.chart_codes, self.chart_names = pd.factorize(pd.Index(charts))
+            codes = self.chart_codes[present]
+            k = len(self.chart_names)
+            counts = np.bincount(codes, minlength=k)
             if self.per_chart_agg == 'absmax':
-                data_z = \
-                list(df_z_smooth.groupby('chart').agg({'z': lambda x: max(x, key=abs)})['z'].to_dict().values())[0]
+                # the value with the max absolute value, keeping its sign
+                high, low = np.full(k, -np.inf), np.full(k, np.inf)
+                np.maximum.at(high, codes, z)
+                np.minimum.at(low, codes, z)
+                agg = np.where(high >= -low, high, low)
+            elif self.per_chart_agg == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    agg = np.bincount(codes, weights=z, minlength=k) / counts
             else:
-                data_z = list(df_z_smooth.groupby('chart').agg({'z': [self.per_chart_agg]})['z'].to_dict().values())[0]
+                agg = pd.Series(z).groupby(codes).agg(self.per_chart_agg).reindex(range(k)).to_numpy()
+            data_z = dict(zip(self.chart_names[counts > 0], agg[counts > 0]))
+        else:
+            data_z = dict(zip(self.engine.metrics[present] + '_z', z))
 
         data_3stddev = {}
         for k in data_z:
@@ -133,12 +297,34 @@ class Service(SimpleService):
 
     def get_data(self):
 
-        if self.runs_counter <= self.burn_in or self.runs_counter % self.train_every_n == 0:
-            self.train_model()
+        # reuse the running mean and stddev saved by the previous run if they are still fresh
+        if self.persist_models and self.warm_start is None:
+            self.warm_start = self.load_model()
+
+        # seed the running mean and stddev from the history in the background, they are updated from every sample
+        # after that. until it is done metrics are scored from the samples collected so far
+        if not self.warm_start and not self.seeded:
+            result = self.trainer.poll()
+            if result is not None:
+                if result.error is not None:
+                    self.error(f'mean and stddev calculation failed: {result.error}')
+                    # during the burn in period the calculation is retried, the running mean and stddev are
+                    # calculated from the samples alone after it
+                    self.seeded = self.runs_counter >= self.burn_in
+                else:
+                    df_mean, df_std = result.value
+                    self.engine.seed(df_mean['mean'], df_std['std'], self.train_secs // self.update_every)
+                    self.seeded = True
+            if not self.seeded and not self.trainer.busy():
+                self.trainer.start(self.train_model)
 
         data_z, data_3stddev = self.create_data(
             get_allmetrics(self.host, self.charts_in_scope, wide=True, col_sep='.').transpose())
         data = {**data_z, **data_3stddev}
+        data['training_time'] = int(self.trainer.last_elapsed * 1000)
+
+        if self.persist_models and self.runs_counter % self.train_every_n == 0:
+            self.save_model()
 
         self.validate_charts('z', data_z, divisor=100)
         self.validate_charts('3stddev', data_3stddev)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# Compares the per line regex parsing of the fail2ban python.d module with the chunked LineMatcher.
+#
+# Usage: benchmark-python-log-matcher.py [lines] [log file]
+#
+# A synthetic fail2ban log is generated if the log file doesn't exist.
+
+import os
+import random
+import re
+import sys
+import time
+import types
+
+from collections import defaultdict
+
+if sys.version_info[:2] > (3, 1):
+    from importlib.machinery import SourceFileLoader
+else:
+    from imp import load_source as SourceFileLoader
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.join(HERE, '..', '..', 'collectors', 'python.d.plugin')
+sys.path.insert(0, os.path.join(PLUGIN_DIR, 'python_modules'))
+
+fail2ban = SourceFileLoader('fail2ban', os.path.join(PLUGIN_DIR, 'fail2ban', 'fail2ban.chart.py'))
+if not isinstance(fail2ban, types.ModuleType):
+    fail2ban = fail2ban.load_module()
+
+JAILS = ['ssh', 'nginx-http-auth', 'dovecot', 'postfix-sasl', 'recidive']
+MONITORING_JAILS = JAILS[:4]
+
+RE_DATA = re.compile(
+    r'\[(?P<jail>[A-Za-z-_0-9]+)\] (?P<action>Ban|Unban|Restore Ban|Found) (?P<ip>[a-f0-9.:]+)'
+)
+
+
+def generate(path, lines):
+    rnd = random.Random(1)
+    with open(path, 'w') as f:
+        for n in range(lines):
+            ip = '10.{0}.{1}.{2}'.format(n % 7, n % 251, rnd.randint(0, 255))
+            jail = rnd.choice(JAILS)
+            r = rnd.random()
+            if r < 0.45:
+                f.write('2018-09-12 11:45:58,727 fail2ban.filter [25029]: INFO    '
+                        '[{0}] Found {1} - 2018-09-12 11:45:58\n'.format(jail, ip))
+            elif r < 0.55:
+                action = rnd.choice(['Ban', 'Unban', 'Restore Ban'])
+                f.write('2018-09-12 11:45:58,727 fail2ban.actions [25029]: NOTICE  '
+                        '[{0}] {1} {2}\n'.format(jail, action, ip))
+            else:
+                f.write('2018-09-12 11:45:58,727 fail2ban.filter [25029]: INFO    '
+                        '[{0}] Ignore {1} by ignoreself rule\n'.format(jail, ip))
+
+
+def new_data():
+    data = dict()
+    for jail in MONITORING_JAILS:
+        data['{0}_failed_attempts'.format(jail)] = 0
+        data[jail] = 0
+        data['{0}_in_jail'.format(jail)] = 0
+    return data
+
+
+def per_line(lines):
+    data, banned_ips = new_data(), defaultdict(set)
+    for row in lines:
+        match = RE_DATA.search(row)
+        if not match:
+            continue
+        match = match.groupdict()
+        if match['jail'] not in MONITORING_JAILS:
+            continue
+        jail, action, ip = match['jail'], match['action'], match['ip']
+        if action == 'Found':
+            data['{0}_failed_attempts'.format(jail)] += 1
+        elif action in ('Ban', 'Restore Ban'):
+            data[jail] += 1
+            if ip not in banned_ips[jail]:
+                banned_ips[jail].add(ip)
+                data['{0}_in_jail'.format(jail)] += 1
+        elif action == 'Unban':
+            if ip in banned_ips[jail]:
+                banned_ips[jail].remove(ip)
+                data['{0}_in_jail'.format(jail)] -= 1
+    return data
+
+
+def chunked(lines):
+    data, banned_ips = new_data(), defaultdict(set)
+    in_jail_keys = dict((jail, '{0}_in_jail'.format(jail)) for jail in MONITORING_JAILS)
+    matcher = fail2ban.log_matcher()
+    matcher.precompute('found', MONITORING_JAILS)
+    counters, matches = matcher.feed(lines)
+    matcher.update(data, counters)
+    for jail, action, ip in matches['actions']:
+        if jail not in in_jail_keys:
+            continue
+        if action in ('Ban', 'Restore Ban'):
+            data[jail] += 1
+            if ip not in banned_ips[jail]:
+                banned_ips[jail].add(ip)
+                data[in_jail_keys[jail]] += 1
+        elif action == 'Unban':
+            if ip in banned_ips[jail]:
+                banned_ips[jail].remove(ip)
+                data[in_jail_keys[jail]] -= 1
+    return data
+
+
+def bench(name, func, path):
+    with open(path) as f:
+        start = time.time()
+        data = func(f)
+        elapsed = time.time() - start
+    print('{0:>10}: {1:.3f} sec'.format(name, elapsed))
+    return data, elapsed
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    path = sys.argv[2] if len(sys.argv) > 2 else '/tmp/benchmark-fail2ban-{0}.log'.format(lines)
+    if not os.path.exists(path):
+        print('generating {0} lines to {1}'.format(lines, path))
+        generate(path, lines)
+
+    # warm up page cache
+    with open(path) as f:
+        for _ in f:
+            pass
+
+    old, old_elapsed = bench('per line', per_line, path)
+    new, new_elapsed = bench('chunked', chunked, path)
+    if old != new:
+        print('RESULTS DIFFER:\n{0}\n{1}'.format(old, new))
+        sys.exit(1)
+    print('{0:>10}: {1:.2f}x'.format('speedup', old_elapsed / new_elapsed))
+
+
+if __name__ == '__main__':
+    main()